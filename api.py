@@ -0,0 +1,366 @@
+"""
+HTTP API for the article generation, for the CMS pipeline and load-balanced
+deployments.
+
+Endpoints:
+    POST /jobs                Submit a generation, returns its job id
+    GET  /jobs/<id>           The status and progress of a job
+    GET  /jobs/<id>/events    The progress of a job as Server-Sent Events
+    GET  /jobs/<id>/result    The generated article, as Markdown
+    GET  /health              Liveness, with the number of jobs per status
+
+The body of POST /jobs is a JSON object:
+    {
+        "article_params": {"keyphrase": "...", "article_type": "listicle", ...},
+        "ai_provider": "claude",        (optional)
+        "model": "claude-3-haiku-...",  (optional)
+        "run_id": "...",                (optional, resumes a failed run)
+        "use_cache": true               (optional)
+    }
+The article params not given default to the ones saved in the params file. The
+provider and model only apply to the job, the params file is never modified.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8000]
+"""
+
+import argparse
+import hmac
+import json
+import re
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from article_generator.jobs import JobManager, QueueFullError
+from article_generator.prompt_templates import get_prompt_templates
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+AI_PROVIDERS = ["openai", "claude"]
+
+# How often an idle event stream sends a comment, so proxies keep it open
+HEARTBEAT_SECONDS = 15
+
+MAX_BODY_BYTES = 1_000_000
+
+JOB_PATH = re.compile(r"^/jobs/([0-9a-f]+)(/events|/result)?$")
+
+
+def parse_job_request(body: dict, params: dict) -> tuple[dict, str | None]:
+    """
+    Validate the body of a job submission
+
+    Args:
+        body (dict): The JSON body of the request
+        params (dict): The params, for the default article params
+
+    Returns:
+        job (dict): The arguments of JobManager.submit
+        error (str | None): The error message if the body is invalid
+    """
+    if not isinstance(body, dict):
+        return {}, "The body must be a JSON object"
+
+    article_params = body.get("article_params") or {}
+    if not isinstance(article_params, dict):
+        return {}, "article_params must be an object"
+
+    unknown = set(article_params) - set(params["article_params"])
+    if unknown:
+        return {}, f"Unknown article params: {', '.join(sorted(unknown))}"
+
+    for name, value in article_params.items():
+        if not isinstance(value, str):
+            return {}, f"The article param {name} must be a string"
+
+    article_params = {**params["article_params"], **article_params}
+    if not article_params.get("keyphrase"):
+        return {}, "The keyphrase is required"
+    if article_params["article_type"] not in get_prompt_templates():
+        return {}, f"Invalid article type: {article_params['article_type']}"
+
+    # The provider and model are overridden for the job only
+    overrides = {}
+    ai_provider = body.get("ai_provider")
+    if ai_provider is not None:
+        if not isinstance(ai_provider, str) or ai_provider not in AI_PROVIDERS:
+            return {}, f"Invalid AI provider: {ai_provider}"
+        overrides["ai_provider"] = ai_provider
+
+    model = body.get("model")
+    if model is not None:
+        if not isinstance(model, str) or not model:
+            return {}, "model must be a non-empty string"
+        ai_provider = ai_provider or params["ai_provider"]
+        overrides[f"{ai_provider}_params"] = {"default_model": model}
+
+    # The provider or model asked for replaces the routes of the stages
+    if overrides:
+        overrides["routing_params"] = {"stages": {"summary": [], "step": []}}
+
+    run_id = body.get("run_id")
+    if run_id is not None and not (
+        isinstance(run_id, str) and re.fullmatch(r"[0-9a-f]{1,32}", run_id)
+    ):
+        return {}, "Invalid run_id"
+
+    use_cache = body.get("use_cache", True)
+    if not isinstance(use_cache, bool):
+        return {}, "use_cache must be a boolean"
+
+    return {
+        "article_params": article_params,
+        "run_id": run_id,
+        "use_cache": use_cache,
+        "overrides": overrides,
+    }, None
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    server_version = "postifyAI"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log.info(f"{self.address_string()} - {format % args}")
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: int, error: str):
+        self.send_json(status, {"error": error})
+
+    def authorized(self) -> bool:
+        api_key = self.server.api_key
+        if not api_key:
+            return True
+
+        # Compared in constant time, so the key can't be guessed from the timings
+        authorization = self.headers.get("Authorization", "")
+        if hmac.compare_digest(
+            authorization.encode("utf-8"), f"Bearer {api_key}".encode("utf-8")
+        ):
+            return True
+
+        self.send_error_json(401, "Invalid or missing API key")
+        return False
+
+    def do_POST(self):
+        # The connection can't be reused after the errors answered before the body
+        # is read, the body would be parsed as the next request
+        close_connection = self.close_connection
+        self.close_connection = True
+
+        if not self.authorized():
+            return
+        if self.path != "/jobs":
+            return self.send_error_json(404, "Not found")
+
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self.send_error_json(411, "The Content-Length header is required")
+        if not re.fullmatch(r"[0-9]{1,12}", length.strip()):
+            return self.send_error_json(400, "Invalid Content-Length header")
+        if int(length) > MAX_BODY_BYTES:
+            return self.send_error_json(413, "The body is too large")
+
+        body = self.rfile.read(int(length))
+        self.close_connection = close_connection
+
+        try:
+            body = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_error_json(400, "The body must be valid JSON")
+
+        job_request, error = parse_job_request(body, ConfigManager().load_params())
+        if error:
+            return self.send_error_json(400, error)
+
+        try:
+            job = self.server.job_manager.submit(**job_request)
+        except QueueFullError as e:
+            return self.send_error_json(503, f"Too many queued jobs, {e}")
+
+        self.send_json(202, {"id": job.id, "status": job.status})
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+
+        if self.path == "/health":
+            with self.server.job_manager.lock:
+                jobs = list(self.server.job_manager.jobs.values())
+            return self.send_json(
+                200, {"status": "ok", "jobs": Counter(job.status for job in jobs)}
+            )
+
+        match = JOB_PATH.match(self.path)
+        job = self.server.job_manager.get(match.group(1)) if match else None
+        if job is None:
+            return self.send_error_json(404, "Not found")
+
+        if match.group(2) == "/events":
+            return self.stream_events(job)
+
+        state = job.snapshot()
+
+        if match.group(2) == "/result":
+            if state["status"] == "failed":
+                return self.send_error_json(422, state["error"])
+            if state["status"] != "complete":
+                return self.send_error_json(409, f"The job is {state['status']}")
+
+            data = state["result"].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/markdown; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        # The step texts are in the result once the job is complete
+        del state["step_texts"]
+        self.send_json(200, state)
+
+    def send_event(self, event: str, data: dict):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def stream_events(self, job):
+        """
+        Stream the progress of a job until it finishes: the status messages, the
+        progress, the text of the steps as it is generated, then a done event
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        status_count = 0
+        progress = None
+        step_texts = {}
+        version = None
+
+        try:
+            while True:
+                state = job.snapshot()
+
+                for text in state["status_texts"][status_count:]:
+                    self.send_event("status", {"text": text})
+                status_count = len(state["status_texts"])
+
+                if (state["progress"], state["progress_text"]) != progress:
+                    progress = (state["progress"], state["progress_text"])
+                    self.send_event(
+                        "progress",
+                        {"progress": progress[0], "text": progress[1]},
+                    )
+
+                # The steps stream their new text only
+                for step, text in sorted(state["step_texts"].items()):
+                    sent = step_texts.get(step, "")
+                    if text != sent:
+                        if text.startswith(sent):
+                            event = {"step": step, "delta": text[len(sent) :]}
+                        else:
+                            event = {"step": step, "text": text}
+                        self.send_event("step", event)
+                        step_texts[step] = text
+
+                if state["status"] in ("complete", "failed"):
+                    self.send_event(
+                        "done",
+                        {
+                            "status": state["status"],
+                            "error": state["error"],
+                            "run_id": state["run_id"],
+                        },
+                    )
+                    return
+
+                previous = version
+                version = job.wait_for_change(state["version"], HEARTBEAT_SECONDS)
+                if version == previous:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+
+        except (BrokenPipeError, ConnectionResetError):
+            log.info(f"Event stream of job {job.id} closed by the client")
+
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, job_manager: JobManager, api_key: str = None):
+        """
+        Args:
+            address (tuple): The host and port to listen on
+            job_manager (JobManager): Runs the submitted generations
+            api_key (str): The bearer token required on every request, None for none
+        """
+        super().__init__(address, APIHandler)
+        self.job_manager = job_manager
+        self.api_key = api_key
+
+
+def create_server(
+    host: str = None, port: int = None, job_manager: JobManager = None
+) -> APIServer:
+    """
+    Create the API server, configured by the api_params
+
+    Args:
+        host (str): The host to listen on, the configured one by default
+        port (int): The port to listen on, the configured one by default, 0 for any
+        job_manager (JobManager): The job manager, e.g. with a stub generator factory
+            in tests. A new one with the configured concurrency by default.
+
+    Returns:
+        APIServer: The server, not started
+    """
+    params = ConfigManager().load_params()
+    api_config = params["api_params"]
+
+    job_manager = job_manager or JobManager(
+        api_config["max_workers"],
+        params["job_params"]["keep_seconds"],
+        max_queued=api_config["max_queued"],
+    )
+
+    return APIServer(
+        (host or api_config["host"], api_config["port"] if port is None else port),
+        job_manager,
+        api_key=api_config["api_key"] or None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the article generation API")
+    parser.add_argument("--host", help="Host to listen on (default: api_params.host)")
+    parser.add_argument(
+        "--port", type=int, help="Port to listen on (default: api_params.port)"
+    )
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    log.info(f"Serving the API on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Shutting down the API")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import time
+
 import streamlit as st
 from PIL import Image
-from article_generator.article_generator import ArticleGenerator
+from article_generator.jobs import get_job_manager
 from utils.config_manager import ConfigManager
 
 
@@ -31,14 +33,18 @@ def main():
         st.session_state.show_claude_params = False
     if "show_serp_params" not in st.session_state:
         st.session_state.show_serp_params = False
-    if "generated_text" not in st.session_state:
-        st.session_state.generated_text = ""
-    if "generating" not in st.session_state:
-        st.session_state.generating = False
-    if "generation_complete" not in st.session_state:
-        st.session_state.generation_complete = False
-    if "generation_error" not in st.session_state:
-        st.session_state.generation_error = None
+
+    # The generations run in the background worker pool, the session only keeps the
+    # id of its job. The id is also in the URL, so a reload reattaches to the job.
+    job_manager = get_job_manager()
+    job_id = st.query_params.get("job")
+    job = job_manager.get(job_id) if job_id else None
+    if job_id and job is None:
+        # The job finished too long ago or the server restarted
+        del st.query_params["job"]
+
+    job_state = job.snapshot() if job else None
+    st.session_state.generating = bool(job) and not job.finished
 
     # --------------------------------- Functions -------------------------------- #
     def get_ai_provider_index(ai_provider: str, ai_provider_list: list[str]) -> int:
@@ -376,50 +382,43 @@ def main():
     #                               Main content area                              #
     # ---------------------------------------------------------------------------- #
 
-    def start_generation():
-        if not st.session_state.generating:
-            st.session_state.generating = True
-            st.session_state.generation_complete = False
-            st.rerun()
-
-    # If the generation process is in progress
-    if st.session_state.generating and not st.session_state.generation_complete:
-
-        progress_text = "Operation in progress. Please wait."
-        progress_bar = st.progress(0, text=progress_text)
-
-        with st.status("Generating article...", expanded=True) as status:
-
-            text, error = ArticleGenerator().generate(progress_bar)
-
-            status.update(label="Article generated!", state="complete", expanded=True)
-
-            st.session_state.generated_text = text
-            st.session_state.generation_error = error
-
-            st.session_state.generating = False
-            st.session_state.generation_complete = True
+    def start_generation(run_id: str = None):
+        # The article params are the ones saved when the job is submitted
+        job = job_manager.submit(params["article_params"], run_id=run_id)
+        st.query_params["job"] = job.id
+        st.rerun()
 
-            st.rerun()
-
-    # If the generation process is not in progress and there wasn't a previous generation
-    # Display the GENERATE button only
-    elif not st.session_state.generating and not st.session_state.generation_complete:
+    # If there is no generation yet, display the GENERATE button only
+    if job_state is None:
         if st.button(
-            "GENERATE" if not st.session_state.generation_complete else "REGENERATE",
+            "GENERATE",
             key="generate_button",
             use_container_width=True,
             type="primary",
         ):
             start_generation()
 
-    # If the generation process is not in progress and there was a previous generation
+    # If the generation is queued or in progress, show its progress until it finishes
+    elif st.session_state.generating:
+
+        st.progress(job_state["progress"], text=job_state["progress_text"])
+
+        with st.status("Generating article...", expanded=True):
+            for text in job_state["status_texts"]:
+                st.write(text)
+
+        # The article is rendered below the status as it is generated
+        for step in sorted(job_state["step_texts"]):
+            st.markdown(job_state["step_texts"][step])
+
+        time.sleep(params["job_params"]["poll_interval"])
+        st.rerun()
+
+    # If the generation is finished
     else:
 
-        if st.session_state.generation_error:
-            st.error(
-                f"Error generating article!\n\n{st.session_state.generation_error}"
-            )
+        if job_state["error"]:
+            st.error(f"Error generating article!\n\n{job_state['error']}")
         else:
             st.success("Article generated successfully!")
 
@@ -434,18 +433,25 @@ def main():
             ):
                 start_generation()
 
+        with buff:
+            if job_state["error"] and job_state["run_id"]:
+                if st.button(
+                    "RESUME",
+                    key="resume_button",
+                    help="Continue the failed run from its last completed step",
+                ):
+                    start_generation(run_id=job_state["run_id"])
+
         with col3:
             if st.download_button(
                 "Download Markdown",
-                st.session_state.generated_text,
+                job_state["result"],
                 file_name="generated_article.md",
             ):
                 st.write("Article downloaded!")
 
         # Display generated text
-        st.markdown(
-            st.session_state.generated_text or "Your article will appear here..."
-        )
+        st.markdown(job_state["result"] or "Your article will appear here...")
 
 
 if __name__ == "__main__":
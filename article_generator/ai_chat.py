@@ -1,332 +1,149 @@
 import time
-from openai import (
-    OpenAI,
-    RateLimitError as OpenAIRateLimitError,
-    APIConnectionError as OpenAIAPIConnectionError,
-    APIError as OpenAIAPIError,
-)
-from anthropic import (
-    Anthropic,
-    RateLimitError as ClaudeRateLimitError,
-    APIConnectionError as ClaudeAPIConnectionError,
-    APIError as ClaudeAPIError,
-)
-from utils.config_manager import ConfigManager
+from typing import Callable
+from article_generator.chat_base import BaseAI, RATE_LIMIT_ERRORS, ResponseStream
+from article_generator.clients import get_client
+from utils import metrics
+from utils.generation_config import GenerationConfig
+from utils.rate_limiter import get_rate_limiter
 from logging_setup import setup_logger
 
 log = setup_logger(__name__)
 
 
-class AI:
-    def __init__(self, system_prompt: str):
+class AI(BaseAI):
+    def __init__(self, system_prompt: str, config: GenerationConfig = None):
+        """
+        Args:
+            system_prompt (str): The system prompt of the conversation
+            config (GenerationConfig): The params of the generation, read from the
+                params file when not given
+        """
 
         log.info("Initializing AI Chat...")
+        super().__init__(system_prompt, config)
 
-        # Initialize the config manager
-        self.config_manager = ConfigManager()
-
-        # Load the param_config.json file
-        self.ai_provider = self.config_manager.load_params()["ai_provider"]
-
-        if self.ai_provider == "openai":
-            log.debug("AI provider: OpenAI")
-            self.openai_init(system_prompt)
-        elif self.ai_provider == "claude":
-            log.debug("AI provider: Claude")
-            self.claude_init(system_prompt)
-        else:
-            raise ValueError("Invalid AI provider")
-
-    def openai_init(self, system_prompt: str):
-        log.info("Initializing OpenAI Chat...")
-
-        config = self.config_manager.load_params()["openai_params"]
-        config = config["openai_params"]
-        self.api_key = config["api_key"]
-        self.max_tokens = config["max_tokens"]
-        self.temperature = config["temperature"]
-        self.max_retries = config["max_retries"]
-        self.default_model = config["default_model"]
-
-        # Initialize the conversation
-        self.conversation = [
-            {"role": "system", "content": system_prompt},
-        ]
-
-        # Setup the Open AI client
+        # Get the shared client of the provider
         try:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_client(self.ai_provider, self.api_key)
         except Exception as e:
-            log.error(f"Error initializing OpenAI client: {e}")
+            log.error(f"Error initializing {self.provider_name} client: {e}")
             raise
 
-    def openai_chat(
-        self,
-        message: str,
-        model: str = None,
-        temperature: float = None,
-        retry_delay: int = 5,
-    ) -> tuple[str, str | None]:
+    def send(
+        self, request: dict, on_delta: Callable[[str, str], None] = None
+    ) -> tuple[str, object, object]:
         """
-        Function to chat with OpenAI
+        Send a request to the provider
 
         Args:
-            message (str): The message to send to OpenAI
-            model (str): The model to use for the response
-            temperature (float): The temperature for the response
-            retry_delay (int): The delay between retries
+            request (dict): The request, see BaseAI.build_request
+            on_delta (Callable): Streams the response, called with each delta and the text so far
 
         Returns:
-            response (str): The response from OpenAI
-            error (str | None): The error message if any
+            tuple: The text, the usage and the headers of the response
         """
-        # Append the message to the messages list
-        self.conversation.append({"role": "user", "content": message})
-
-        # Initialize the attempt counter
-        attempt = 0
-        attempt_success = False
-
-        # Loop to retry the request if it fails
-        while attempt < self.max_retries and not attempt_success:
-            attempt += 1
-
-            # Get the response from OpenAI
-            try:
-                log.info("Sending message to OpenAI...")
-                response = self.client.chat.completions.create(
-                    messages=self.conversation,
-                    max_tokens=self.max_tokens,
-                    temperature=temperature if temperature else self.temperature,
-                    model=model if model else self.default_model,
-                    response_format={"type": "text"},
-                )
-                attempt_success = True
-                log.info("Got response from OpenAI")
-
-            except OpenAIRateLimitError as e:
-                # Handle rate limit error with exponential backoff
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for rate limit.")
-                    return "", "Max retries reached for rate limit."
-
-                log.warning("Rate limit error. Retrying...")
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
-
-            except OpenAIAPIConnectionError as e:
-                # Handle API connection error
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for connection errors.")
-                    return "", "Max retries reached for connection errors."
-
-                log.warning("API connection error. Retrying...")
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
-
-            except OpenAIAPIError as e:
-                # Handle general API errors
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for API errors.")
-                    return (
-                        "",
-                        "Max retries reached for API errors. Please check that your OpenAI API key is correct.",
-                    )
-
-                log.warning("API error. Retrying...")
-                log.debug(e)
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
-
-            except Exception as e:
-                # Catch-all for any other exceptions
-                log.error(f"Error sending message to OpenAI: {e}")
-
-                return (
-                    "",
-                    "An unexpected error occurred while getting the response from OpenAI.",
-                )
-
-        # Get the content of the response
-        content = response.choices[0].message.content
-
-        # Append the response to the messages list
-        self.conversation.append({"role": "assistant", "content": content})
-
-        return content, None
-
-    def claude_init(self, system_prompt):
-        config = self.config_manager.load_params()["claude_params"]
-        self.conversation = []
-        self.api_key = config["api_key"]
-        self.max_tokens = config["max_tokens"]
-        self.temperature = config["temperature"]
-        self.max_retries = config["max_retries"]
-        self.default_model = config["default_model"]
-
-        self.system = system_prompt
-
-        # Setup the Claude client
-        try:
-            self.client = Anthropic(api_key=self.api_key)
-        except Exception as e:
-            log.error(f"Error initializing Claude client: {e}")
-            raise
+        if self.ai_provider == "openai":
+            raw_response = self.client.chat.completions.with_raw_response.create(
+                **request
+            )
+            response = raw_response.parse()
+            if not on_delta:
+                return *self.parse_response(response), raw_response.headers
+
+            # A retry restarts the response, so the text so far is reset too
+            stream = ResponseStream(on_delta)
+            usage = None
+            for chunk in response:
+                delta, chunk_usage = self.parse_openai_chunk(chunk)
+                usage = chunk_usage or usage
+                stream.add(delta)
+
+            return stream.text, usage, raw_response.headers
+
+        if not on_delta:
+            raw_response = self.client.messages.with_raw_response.create(**request)
+            return *self.parse_response(raw_response.parse()), raw_response.headers
+
+        stream = ResponseStream(on_delta)
+        with self.client.messages.stream(**request) as response:
+            for delta in response.text_stream:
+                stream.add(delta)
+
+            return (
+                stream.text,
+                response.get_final_message().usage,
+                response.response.headers,
+            )
 
-    def claude_chat(
+    def chat(
         self,
         message: str,
         model: str = None,
         temperature: float = None,
         retry_delay: int = 5,
+        on_delta: Callable[[str, str], None] = None,
     ) -> tuple[str, str | None]:
         """
-        Function to chat with Claude
+        Function to chat with the AI provider
 
         Args:
-            message (str): The message to send to Claude
+            message (str): The message to send to the AI provider
             model (str): The model to use for the response
             temperature (float): The temperature for the response
             retry_delay (int): The delay between retries
+            on_delta (Callable): Streams the response, called with each delta and the text so far
 
         Returns:
-            response (str): The response from Claude
+            response (str): The response from the AI provider
             error (str | None): The error message if any
         """
 
-        log.info("Sending message to Claude...")
+        log.info("Sending AI message...")
 
-        # Append the message to the messages list
-        self.conversation.append({"role": "user", "content": message})
+        request = self.build_request(message, model, temperature, bool(on_delta))
+        model = request["model"]
 
-        # Initialize the attempt counter
-        attempt = 0
-        attempt_success = False
+        # The calls of all the threads and processes share the rate limits
+        rate_limiter = get_rate_limiter()
 
         # Loop to retry the request if it fails
-        while attempt < self.max_retries and not attempt_success:
+        attempt = 0
+        while True:
             attempt += 1
+            if attempt > 1:
+                metrics.add(retries=1)
 
-            # Get the response from OpenAI
             try:
-                response = self.client.messages.create(
-                    model=model if model else self.default_model,
-                    max_tokens=self.max_tokens,
-                    temperature=temperature if temperature else self.temperature,
-                    system=self.system,
-                    messages=self.conversation,
-                )
-                attempt_success = True
-
-            except ClaudeRateLimitError as e:
-                # Handle rate limit error with exponential backoff
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for rate limit.")
-                    return "", "Max retries reached for rate limit."
-
-                log.warning("Rate limit error. Retrying...")
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
-
-            except ClaudeAPIConnectionError as e:
-                # Handle API connection error
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for connection errors.")
-                    return "", "Max retries reached for connection errors."
-
-                log.warning("API connection error. Retrying...")
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
-
-            except ClaudeAPIError as e:
-                # Handle general API errors
-
-                if attempt == self.max_retries:
-                    log.error("Max retries reached for API errors.")
+                # Wait for room in the rate limits of the model
+                if rate_limiter:
+                    rate_limiter.acquire(
+                        self.ai_provider,
+                        model,
+                        self.conversation_manager.last_input_tokens,
+                    )
 
-                    # Handle overloaded API
-                    if "529" in str(e):
-                        return (
-                            "",
-                            "Max retries reached for API errors. Anthropic API seems to be overloaded right now, please try again later.",
-                        )
+                log.info(f"Sending message to {self.provider_name}...")
+                content, usage, headers = self.send(request, on_delta)
+                log.info(f"Got response from {self.provider_name}")
+                self.record_usage(usage)
 
-                    return (
-                        "",
-                        "Max retries reached for API errors. Please check that your Claude API key is correct.",
+                # Adapt the rate limits to the quota reported by the provider
+                if rate_limiter:
+                    rate_limiter.observe_headers(self.ai_provider, model, headers)
+                    rate_limiter.record_tokens(
+                        self.ai_provider, model, self.last_usage.get("output_tokens", 0)
                     )
 
-                log.warning("API error. Retrying...")
-                log.debug(e)
-                delay = retry_delay * (2**attempt)
-                time.sleep(delay)
+                return self.reply(content)
 
             except Exception as e:
-                # Catch-all for any other exceptions
-
-                log.error(f"Error sending message to Claude: {e}")
-                return (
-                    "",
-                    "An unexpected error occurred while getting the response from Claude.",
-                )
-
-        # Get the content of the response
-        content = response.content[0].text
-
-        # Append the response to the messages list
-        self.conversation.append({"role": "assistant", "content": content})
-
-        return content, None
-
-    def chat(
-        self,
-        message: str,
-        model: str = None,
-        temperature: float = None,
-        retry_delay: int = 5,
-    ) -> tuple[str, str | None]:
-        """
-        Function to chat with the AI provider
+                delay, error = self.handle_error(e, attempt, retry_delay)
 
-        Args:
-            message (str): The message to send to the AI provider
-            model (str): The model to use for the response
-            temperature (float): The temperature for the response
-            retry_delay (int): The delay between retries
+                # Hold the other calls back too after a rate limit error
+                if rate_limiter and isinstance(e, RATE_LIMIT_ERRORS):
+                    rate_limiter.block(self.ai_provider, model, delay)
 
-        Returns:
-            response (str): The response from the AI provider
-            error (str | None): The error message if any
-        """
-
-        log.info("Sending AI message...")
-
-        if self.ai_provider == "openai":
-            response, error = self.openai_chat(
-                message,
-                model=model,
-                temperature=temperature,
-                retry_delay=retry_delay,
-            )
+                if error:
+                    return self.fail(error)
 
-            if error:
-                log.error(f"Error sending message to OpenAI: {error}")
-                return "", f"Error sending message to OpenAI:\n\n{error}"
-
-            return response, None
-
-        elif self.ai_provider == "claude":
-            response, error = self.claude_chat(
-                message, model=model, temperature=temperature, retry_delay=retry_delay
-            )
-
-            if error:
-                log.error(f"Error sending message to Claude: {error}")
-                return "", f"Error sending message to Claude:\n\n{error}"
-
-            return response, None
+                time.sleep(delay)
@@ -1,23 +1,35 @@
 # article_generator.py
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 from article_generator.ai_chat import AI
-from utils.config_manager import ConfigManager
+from article_generator.router import create_chat
+from utils.generation_config import GenerationConfig, thaw
 from article_generator import serp_api, content_fetcher, summarizer
+from article_generator.prompt_templates import get_prompt_templates
+from article_generator.progress import ProgressReporter
+from article_generator.run_store import RunStore, params_fingerprint
+from utils import metrics
 from logging_setup import setup_logger
-import streamlit as st
 
 log = setup_logger(__name__)
 
 
 class ArticleGenerator:
-    def __init__(self):
+    def __init__(self, article_params: dict = None, config: GenerationConfig = None):
+        """
+        Args:
+            article_params (dict): Article params overriding the ones of the config
+            config (GenerationConfig): The params of the generation, read from the
+                params file when not given. Every stage of the run uses this config.
+        """
         log.info("Initializing Article Generator...")
 
-        # Initialize the config manager
-        self.config_manager = ConfigManager()
-
-        # Load article_params from the param_config.json file
-        self.article_params = self.config_manager.load_params()["article_params"]
+        config = config or GenerationConfig.load()
+        if article_params:
+            config = config.replace({"article_params": article_params})
+        self.config = config
+        self.article_params = thaw(self.config["article_params"])
         self.language = self.article_params["language"]
         self.article_type = self.article_params["article_type"]
         self.expertise_field = self.article_params["expertise_field"]
@@ -26,145 +38,271 @@ class ArticleGenerator:
         self.product_description = self.article_params["product_description"]
         self.product_url = self.article_params["product_url"]
 
-        # Load the AI steps for the type of article
-        self.ai_prompts = self.config_manager.load_prompts()
+        # Load the compiled templates for the type of article, their placeholders are
+        # validated when the prompts file is compiled
+        templates = get_prompt_templates()[self.article_type]
+        self.system_prompt = templates["system_prompt"]
+        self.steps = templates["steps"]
+
+        # The variables of the templates, all but the content summary are known now
+        self.prompt_variables = {
+            "language": self.language,
+            "expertise_field": self.expertise_field,
+            "keyphrase": self.keyphrase,
+            "product_name": self.product_name,
+            "product_description": self.product_description,
+            "product_url": self.product_url,
+            "combined_content_summary": "",
+        }
+
+        # Steps without depends_on depend on every step before them, so they see the
+        # whole conversation before them. The other steps only see the turns of their
+        # ancestors.
+        self.dependencies = []
+        self.ancestors = []
+        for index, step in enumerate(self.steps):
+            if step["depends_on"] is None:
+                dependencies = set(range(index))
+            else:
+                dependencies = set(step["depends_on"])
 
-        # Load the prompt config for the article type
-        self.ai_prompts = self.ai_prompts[self.article_type]
+            if any(not 0 <= dependency < index for dependency in dependencies):
+                raise ValueError(
+                    f"Step {index + 1} of {self.article_type} can only depend on previous steps"
+                )
 
-        self.system_prompt = "\n".join(self.ai_prompts["system_prompt"])
+            ancestors = set(dependencies)
+            for dependency in dependencies:
+                ancestors |= self.ancestors[dependency]
 
-        # Load the steps. Take into account that for each step, the prompt must be joined into a single string
-        self.steps = [
-            {
-                "printout": step["printout"],
-                "enhanced": step["enhanced"],
-                "prompt": "\n".join(step["prompt"]),
-            }
-            for step in self.ai_prompts["steps"]
-        ]
+            self.dependencies.append(dependencies)
+            self.ancestors.append(ancestors)
+
+        self.max_parallel_steps = self.config["generation_params"]["max_parallel_steps"]
+        self.checkpoints_enabled = self.config["run_params"]["enabled"]
+        self.run_store = None
+        self.run_id = None
 
         log.info("Article Genertor Initialized.")
 
-    def generate(self, progress_bar) -> tuple[str, str | None]:
+    def generate(
+        self,
+        progress: ProgressReporter = None,
+        use_cache: bool = True,
+        run_id: str = None,
+    ) -> tuple[str, str | None]:
         """
         Generate the article based on the parameters and steps defined in the config files
 
+        Each stage is checkpointed in data/runs/<run_id>, the id of the run is in
+        self.run_id once it starts.
+
+        Args:
+            progress (ProgressReporter): Receives the progress events of the generation
+            use_cache (bool): Whether to reuse the cached search results, pages and summaries
+            run_id (str): A failed or interrupted run to resume from its last completed
+                stage and steps. A new run is started if its article params changed.
+
+        Returns:
+            tuple: The generated article and an error message if there was an error
+        """
+        resumed = False
+        if self.checkpoints_enabled:
+            self.run_store = RunStore(run_id)
+            if self.run_store.exists and not self.run_store.can_resume(
+                self.article_params
+            ):
+                log.warning(
+                    f"The article params changed since run {run_id}, starting a new run"
+                )
+                self.run_store = RunStore()
+
+            self.run_id = self.run_store.run_id
+            resumed = self.run_store.exists
+            self.run_store.update_run(
+                status="running",
+                error=None,
+                article_params=self.article_params,
+                fingerprint=params_fingerprint(self.article_params),
+            )
+            log.info(f"{'Resuming' if resumed else 'Starting'} run {self.run_id}")
+
+        # Time every stage of the run, the report is saved even if the run fails, as
+        # data/metrics/<run_id>.json. A resumed run replaces the report of its
+        # previous attempt.
+        self.run_metrics = metrics.RunMetrics(self.run_id)
+        with self.run_metrics.activate(), metrics.span(
+            "run",
+            article_type=self.article_type,
+            keyphrase=self.keyphrase,
+            run_id=self.run_id,
+            resumed=resumed,
+        ):
+            article, error = self.run_pipeline(
+                progress or ProgressReporter(), use_cache
+            )
+
+        self.run_metrics.save()
+
+        if self.run_store:
+            if error:
+                self.run_store.update_run(status="failed", error=error)
+            else:
+                self.run_store.save_article(article)
+                self.run_store.update_run(status="complete")
+
+        return article, error
+
+    def load_checkpoint(self, stage: str):
+        """
+        Get the output of a stage completed by a previous attempt of the run
+
+        Args:
+            stage (str): The stage, see run_store.STAGES
+
+        Returns:
+            The output, None if the stage has to run
+        """
+        if not self.run_store:
+            return None
+
+        value = self.run_store.load_stage(stage)
+        if value is not None:
+            log.info(f"Resuming the {stage} of run {self.run_id}")
+        return value
+
+    def save_checkpoint(self, stage: str, value):
+        if self.run_store:
+            self.run_store.save_stage(stage, value)
+
+    def run_pipeline(
+        self, progress: ProgressReporter, use_cache: bool
+    ) -> tuple[str, str | None]:
+        """
+        Run the SERP, fetch, summarize and article steps stages of a generation
+
         Returns:
             tuple: The generated article and an error message if there was an error
         """
 
         log.info("Generating the article...")
 
+        # The stages completed by a previous attempt of the run are loaded instead
+        urls = self.load_checkpoint("urls")
+        contents = self.load_checkpoint("contents")
+        summaries = self.load_checkpoint("summaries")
+        combined_content_summary = self.load_checkpoint("combined_summary")
+        summary_stats = summarizer.SummaryStats()
+
         # Get the top urls from the search engine
-        log.info(f"Getting top URLs for keyphrase: {self.keyphrase}")
-        st.write("Getting top URLs for keyphrase: ", self.keyphrase)
-        urls, serpapi_error = serp_api.get_google_search_top_urls(self.keyphrase)
+        if urls is None and contents is None:
+            log.info(f"Getting top URLs for keyphrase: {self.keyphrase}")
+            progress.status(f"Getting top URLs for keyphrase: {self.keyphrase}")
+            with metrics.span("serp"):
+                urls, serpapi_error = serp_api.get_google_search_top_urls(
+                    self.keyphrase, use_cache=use_cache, config=self.config
+                )
 
-        if serpapi_error:
-            log.error(f"Error getting SERP URLs: {serpapi_error}")
-            return "", f"Error getting SERP URLs:\n\n{serpapi_error}"
+            if serpapi_error:
+                log.error(f"Error getting SERP URLs: {serpapi_error}")
+                return "", f"Error getting SERP URLs:\n\n{serpapi_error}"
 
-        progress_bar.progress(5, text="Got top URLs for keyphrase.")
+            self.save_checkpoint("urls", urls)
 
-        # Get the content from the top urls
-        log.info("Fetching content from the top URLs...")
-        st.write("Fetching content from the top URLs...")
-        contents, content_fetching_error = content_fetcher.fetch_all_contents(urls)
-        if content_fetching_error:
-            log.error(f"Error fetching content: {content_fetching_error}")
-            return "", f"Error fetching content:\n\n{content_fetching_error}"
+        progress.progress(0.05, text="Got top URLs for keyphrase.")
 
-        log.info(f"Fetched {len(contents)} contents")
-        progress_bar.progress(10, text="Fetched content from top URLs.")
+        # Get the content from the top urls
+        if contents is None and summaries is None:
+            log.info("Fetching content from the top URLs...")
+            progress.status("Fetching content from the top URLs...")
+            with metrics.span("fetch_all", urls=len(urls)):
+                contents, content_fetching_error = content_fetcher.fetch_all_contents(
+                    urls, use_cache=use_cache, config=self.config
+                )
+            if content_fetching_error:
+                log.error(f"Error fetching content: {content_fetching_error}")
+                return "", f"Error fetching content:\n\n{content_fetching_error}"
+
+            log.info(f"Fetched {len(contents)} contents")
+            self.save_checkpoint("contents", contents)
+
+        progress.progress(0.10, text="Fetched content from top URLs.")
 
         # Summarize each content
-        log.info("Summarizing the content...")
-        st.write("Summarizing the content...")
-        summaries = []
+        if summaries is None and combined_content_summary is None:
+            log.info("Summarizing the content...")
+            progress.status("Summarizing the content...")
+            with metrics.span("summarize_all", contents=len(contents)):
+                summaries, summary_error = summarizer.summarize_websites(
+                    contents,
+                    use_cache=use_cache,
+                    stats=summary_stats,
+                    config=self.config,
+                )
 
-        for content in contents:
-            summary, summary_error = summarizer.summarize_website(content)
             if summary_error:
                 log.error(f"Error summarizing content: {summary_error}")
                 return "", f"Error summarizing content:\n\n{summary_error}"
-            summaries.append(summary)
 
-        log.info(f"Summarized {len(summaries)} contents.")
+            log.info(f"Summarized {len(summaries)} contents.")
+            self.save_checkpoint("summaries", summaries)
 
-        progress_bar.progress(15, text="Summarized individual website content.")
+        progress.progress(0.15, text="Summarized individual website content.")
 
         # Combine all the summaries into one summary
-        log.info("Combining the content summaries...")
-        st.write("Combining the content summaries...")
-        combined_content_summary, summary_error = summarizer.summarize_website(
-            "\n".join(summaries)
-        )
+        if combined_content_summary is None:
+            log.info("Combining the content summaries...")
+            progress.status("Combining the content summaries...")
+            with metrics.span("combine", summaries=len(summaries)):
+                combined_content_summary, summary_error = summarizer.combine_summaries(
+                    summaries,
+                    use_cache=use_cache,
+                    stats=summary_stats,
+                    config=self.config,
+                )
+
+            if summary_error:
+                log.error(f"Error creating the combined summary: {summary_error}")
+                return "", f"Error creating the combined summary:\n\n{summary_error}"
 
-        if summary_error:
-            log.error(f"Error creating the combined summary: {summary_error}")
-            return "", f"Error creating the combined summary:\n\n{summary_error}"
+            self.save_checkpoint("combined_summary", combined_content_summary)
 
-        progress_bar.progress(20, text="Summarized all reference content.")
+        progress.progress(0.20, text="Summarized all reference content.")
 
-        log.info("Content Summarized.")
+        log.info(f"Content Summarized, {summary_stats}.")
 
         # Populate the system prompt with the variables
-        formatted_system_prompt = self.system_prompt.format(
-            language=self.language,
-            expertise_field=self.expertise_field,
-            keyphrase=self.keyphrase,
-            product_name=self.product_name,
-            product_description=self.product_description,
-            product_url=self.product_url,
-            combined_content_summary=combined_content_summary,
-        )
+        variables = {
+            **self.prompt_variables,
+            "combined_content_summary": combined_content_summary,
+        }
+        formatted_system_prompt = self.system_prompt.render(variables)
 
         # Initialize the AI chat
         log.info("Initializing AI Chat...")
-        st.write("Initializing AI Chat...")
+        progress.status("Initializing AI Chat...")
         try:
-            ai_chat = AI(formatted_system_prompt)
+            ai_chat = create_chat(formatted_system_prompt, self.config, "step")
         except Exception as e:
             log.error(f"Error initializing AI Chat: {e}")
             return "", f"Error initializing AI Chat"
         log.info("AI Chat Initialized.")
 
-        progress_bar.progress(22, text="Initialized AI Chat.")
-
-        # Loop through the steps and generate the article
-        full_article_list = []
-        for index, step in enumerate(self.steps):
-            log.info(f"Processing step {index + 1} out of {len(self.steps)}")
-            st.write(f"Processing step {index + 1} out of {len(self.steps)}")
-
-            # Format the prompt
-            step_prompt = step["prompt"].format(
-                language=self.language,
-                expertise_field=self.expertise_field,
-                keyphrase=self.keyphrase,
-                product_name=self.product_name,
-                product_description=self.product_description,
-                product_url=self.product_url,
-                combined_content_summary=combined_content_summary,
-            )
-            # Get the AI response
-            response, response_error = ai_chat.chat(step_prompt)
-
-            if response_error:
-                log.error(f"Error processing step {index + 1}: {response_error}")
-                return "", f"Error processing step {index + 1}:\n\n{response_error}"
+        progress.progress(0.22, text="Initialized AI Chat.")
 
-            progress_float = 0.22 + (index + 1) * 80 / (len(self.steps) * 100)
-            progress_float = min(progress_float, 1)  # Ensure it doesn't go over 1
+        # Run the steps and generate the article
+        responses, steps_error = self.run_steps(
+            ai_chat, combined_content_summary, progress
+        )
 
-            progress_bar.progress(
-                progress_float,
-                text=f"Step {index + 1} completed.",
-            )
+        if steps_error:
+            return "", steps_error
 
-            if step["printout"]:
-                full_article_list.append(response)
+        full_article_list = [
+            response
+            for step, response in zip(self.steps, responses)
+            if step["printout"]
+        ]
 
         # Combine the article parts into a single article
         full_article = "\n".join(full_article_list)
@@ -172,3 +310,145 @@ class ArticleGenerator:
         log.info("Article generation complete!")
 
         return full_article, None
+
+    def run_steps(
+        self, ai_chat: AI, combined_content_summary: str, progress: ProgressReporter
+    ) -> tuple[list[str], str | None]:
+        """
+        Run the steps of the article, each one as soon as the steps it depends on are done
+
+        Independent steps run concurrently, each one on a fork of the chat holding only
+        the turns of its ancestor steps.
+
+        Args:
+            ai_chat (AI): The chat initialized with the system prompt
+            combined_content_summary (str): The summary of the reference content
+            progress (ProgressReporter): Receives the progress events of the generation
+
+        Returns:
+            responses (list[str]): The response of each step, in template order
+            error (str | None): The error message if any
+        """
+
+        # Format the prompts
+        variables = {
+            **self.prompt_variables,
+            "combined_content_summary": combined_content_summary,
+        }
+        prompts = [step["template"].render(variables) for step in self.steps]
+
+        responses = {}
+        step_input_tokens = {}
+        running = {}
+
+        # Reuse the steps completed by a previous attempt of the run, unless their
+        # prompt changed since
+        completed = self.run_store.load_steps() if self.run_store else {}
+        for index, step in sorted(completed.items()):
+            if index < len(prompts) and step["prompt"] == prompts[index]:
+                responses[index] = step["response"]
+                step_input_tokens[index] = 0
+                if self.steps[index]["printout"]:
+                    progress.step_text(index, step["response"])
+
+        if responses:
+            log.info(f"Resuming {len(responses)} completed steps of run {self.run_id}")
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_steps) as executor:
+            while len(responses) < len(self.steps):
+
+                # Start the steps whose dependencies are done
+                for index, dependencies in enumerate(self.dependencies):
+                    if index in responses or index in running.values():
+                        continue
+                    if not dependencies <= responses.keys():
+                        continue
+
+                    log.info(f"Processing step {index + 1} out of {len(self.steps)}")
+                    progress.status(
+                        f"Processing step {index + 1} out of {len(self.steps)}"
+                    )
+
+                    # Fork the chat with the turns of the ancestor steps only
+                    context = []
+                    for ancestor in sorted(self.ancestors[index]):
+                        context.append({"role": "user", "content": prompts[ancestor]})
+                        context.append(
+                            {"role": "assistant", "content": responses[ancestor]}
+                        )
+
+                    future = metrics.submit(
+                        executor,
+                        self.run_step,
+                        ai_chat.fork(context),
+                        index,
+                        prompts[index],
+                        progress,
+                    )
+                    running[future] = index
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index = running.pop(future)
+                    response, response_error, input_tokens = future.result()
+
+                    if response_error:
+                        log.error(
+                            f"Error processing step {index + 1}: {response_error}"
+                        )
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        return (
+                            [],
+                            f"Error processing step {index + 1}:\n\n{response_error}",
+                        )
+
+                    responses[index] = response
+                    step_input_tokens[index] = input_tokens
+
+                    progress.progress(
+                        0.22 + len(responses) * 0.78 / len(self.steps),
+                        text=f"Step {index + 1} completed.",
+                    )
+
+        steps = range(len(self.steps))
+        log.info(f"Input tokens per step: {[step_input_tokens[i] for i in steps]}")
+
+        return [responses[index] for index in steps], None
+
+    def run_step(
+        self, ai_chat: AI, index: int, prompt: str, progress: ProgressReporter
+    ) -> tuple[str, str | None, int]:
+        """
+        Run a single step on its own fork of the chat
+
+        Returns:
+            response (str): The response of the step
+            error (str | None): The error message if any
+            input_tokens (int): The input tokens sent for the step
+        """
+
+        # Get the AI response, streaming the steps that are part of the article
+        def stream_step_text(delta: str, text: str):
+            progress.step_text(index, text)
+
+        with metrics.span("step", step=index + 1):
+            response, response_error = ai_chat.chat(
+                prompt,
+                on_delta=stream_step_text if self.steps[index]["printout"] else None,
+            )
+
+        if response_error:
+            return "", response_error, 0
+
+        if self.run_store:
+            self.run_store.save_step(index, prompt, response, ai_chat.conversation)
+
+        conversation_manager = ai_chat.conversation_manager
+        log.info(
+            f"Step {index + 1} sent {conversation_manager.last_input_tokens} input "
+            f"tokens ({conversation_manager.last_full_input_tokens} uncompacted), "
+            f"usage: {ai_chat.last_usage}"
+        )
+
+        return response, None, conversation_manager.last_input_tokens
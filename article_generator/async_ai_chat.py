@@ -0,0 +1,140 @@
+import asyncio
+from typing import Callable
+from article_generator.chat_base import BaseAI, RATE_LIMIT_ERRORS, ResponseStream
+from article_generator.clients import get_async_client
+from utils import metrics
+from utils.generation_config import GenerationConfig
+from utils.rate_limiter import get_rate_limiter_async
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+
+class AsyncAI(BaseAI):
+    """
+    Async counterpart of AI, to drive many chats from one event loop
+    """
+
+    def __init__(self, system_prompt: str, config: GenerationConfig = None):
+        """
+        Args:
+            system_prompt (str): The system prompt of the conversation
+            config (GenerationConfig): The params of the generation, read from the
+                params file when not given
+        """
+
+        log.info("Initializing async AI Chat...")
+        super().__init__(system_prompt, config)
+
+    @property
+    def client(self):
+        # The async clients are bound to the running event loop
+        return get_async_client(self.ai_provider, self.api_key)
+
+    async def send(
+        self, request: dict, on_delta: Callable[[str, str], None] = None
+    ) -> tuple[str, object, object]:
+        """
+        Send a request to the provider, see AI.send
+        """
+        client = self.client
+
+        if self.ai_provider == "openai":
+            raw_response = await client.chat.completions.with_raw_response.create(
+                **request
+            )
+            # The raw responses of the OpenAI SDK are parsed synchronously
+            response = raw_response.parse()
+            if not on_delta:
+                return *self.parse_response(response), raw_response.headers
+
+            # A retry restarts the response, so the text so far is reset too
+            stream = ResponseStream(on_delta)
+            usage = None
+            async for chunk in response:
+                delta, chunk_usage = self.parse_openai_chunk(chunk)
+                usage = chunk_usage or usage
+                stream.add(delta)
+
+            return stream.text, usage, raw_response.headers
+
+        if not on_delta:
+            raw_response = await client.messages.with_raw_response.create(**request)
+            response = await raw_response.parse()
+            return *self.parse_response(response), raw_response.headers
+
+        stream = ResponseStream(on_delta)
+        async with client.messages.stream(**request) as response:
+            async for delta in response.text_stream:
+                stream.add(delta)
+
+            return (
+                stream.text,
+                (await response.get_final_message()).usage,
+                response.response.headers,
+            )
+
+    async def chat(
+        self,
+        message: str,
+        model: str = None,
+        temperature: float = None,
+        retry_delay: int = 5,
+        on_delta: Callable[[str, str], None] = None,
+    ) -> tuple[str, str | None]:
+        """
+        Function to chat with the AI provider, see AI.chat
+        """
+
+        log.info("Sending async AI message...")
+
+        request = self.build_request(message, model, temperature, bool(on_delta))
+        model = request["model"]
+
+        # The calls of all the threads and processes share the rate limits, the
+        # SQLite buckets are only used from threads, not to block the event loop
+        rate_limiter = await get_rate_limiter_async()
+
+        # Loop to retry the request if it fails
+        attempt = 0
+        while True:
+            attempt += 1
+            if attempt > 1:
+                metrics.add(retries=1)
+
+            try:
+                # Wait for room in the rate limits of the model
+                if rate_limiter:
+                    await rate_limiter.acquire_async(
+                        self.ai_provider,
+                        model,
+                        self.conversation_manager.last_input_tokens,
+                    )
+
+                log.info(f"Sending message to {self.provider_name}...")
+                content, usage, headers = await self.send(request, on_delta)
+                log.info(f"Got response from {self.provider_name}")
+                self.record_usage(usage)
+
+                # Adapt the rate limits to the quota reported by the provider
+                if rate_limiter:
+                    await rate_limiter.observe_headers_async(
+                        self.ai_provider, model, headers
+                    )
+                    await rate_limiter.record_tokens_async(
+                        self.ai_provider, model, self.last_usage.get("output_tokens", 0)
+                    )
+
+                return self.reply(content)
+
+            except Exception as e:
+                delay, error = self.handle_error(e, attempt, retry_delay)
+
+                # Hold the other calls back too after a rate limit error
+                if rate_limiter and isinstance(e, RATE_LIMIT_ERRORS):
+                    await rate_limiter.block_async(self.ai_provider, model, delay)
+
+                if error:
+                    return self.fail(error)
+
+                await asyncio.sleep(delay)
@@ -0,0 +1,286 @@
+import copy
+import time
+from typing import Callable
+from openai import (
+    RateLimitError as OpenAIRateLimitError,
+    APIConnectionError as OpenAIAPIConnectionError,
+    APIError as OpenAIAPIError,
+)
+from anthropic import (
+    RateLimitError as ClaudeRateLimitError,
+    APIConnectionError as ClaudeAPIConnectionError,
+    APIError as ClaudeAPIError,
+)
+from article_generator.conversation import ConversationManager
+from article_generator.prompt_caching import (
+    claude_cached_prompt,
+    claude_usage,
+    openai_prompt_cache_key,
+    openai_usage,
+)
+from utils import metrics
+from utils.generation_config import GenerationConfig
+from utils.rate_limiter import backoff_delay, retry_after_seconds
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+PROVIDER_NAMES = {"openai": "OpenAI", "claude": "Claude"}
+
+# The errors of both SDKs, the rate limit and connection errors are API errors too
+RATE_LIMIT_ERRORS = (OpenAIRateLimitError, ClaudeRateLimitError)
+CONNECTION_ERRORS = (OpenAIAPIConnectionError, ClaudeAPIConnectionError)
+API_ERRORS = (OpenAIAPIError, ClaudeAPIError)
+
+
+class ResponseStream:
+    """
+    Collects the text of a streamed response, sending each delta on
+    """
+
+    def __init__(self, on_delta: Callable[[str, str], None]):
+        self.on_delta = on_delta
+        self.text = ""
+        self.start = time.perf_counter()
+
+    def add(self, delta: str | None):
+        if not delta:
+            return
+
+        if not self.text:
+            log.info(f"First token after {time.perf_counter() - self.start:.2f}s")
+
+        self.text += delta
+        self.on_delta(delta, self.text)
+
+
+class BaseAI:
+    """
+    The part of AI and AsyncAI that doesn't depend on how the requests are sent: the
+    params and conversation of the chat, the request of each provider, and the
+    handling of the responses and errors
+    """
+
+    def __init__(self, system_prompt: str, config: GenerationConfig = None):
+        """
+        Args:
+            system_prompt (str): The system prompt of the conversation
+            config (GenerationConfig): The params of the generation, read from the
+                params file when not given
+        """
+
+        # The params of the generation the chat is part of
+        self.config = config or GenerationConfig.load()
+        params = self.config
+        self.ai_provider = params["ai_provider"]
+
+        if self.ai_provider == "openai":
+            log.debug("AI provider: OpenAI")
+
+            # The OpenAI conversation starts with the system message
+            self.conversation = [{"role": "system", "content": system_prompt}]
+        elif self.ai_provider == "claude":
+            log.debug("AI provider: Claude")
+            self.conversation = []
+        else:
+            raise ValueError("Invalid AI provider")
+
+        provider_config = params[f"{self.ai_provider}_params"]
+        self.provider_name = PROVIDER_NAMES[self.ai_provider]
+        self.system = system_prompt
+        self.api_key = provider_config["api_key"]
+        self.max_tokens = provider_config["max_tokens"]
+        self.temperature = provider_config["temperature"]
+        self.max_retries = provider_config["max_retries"]
+        self.default_model = provider_config["default_model"]
+
+        self.conversation_manager = ConversationManager(**params["conversation_params"])
+
+        # Mark the stable prompt prefix as cacheable, and keep the last response usage
+        self.prompt_caching = params["cache_params"]["prompt_caching"]
+        self.last_usage = {}
+
+    def fork(self, turns: list[dict]):
+        """
+        Create a chat sharing the client and system prompt, with its own conversation
+
+        Args:
+            turns (list[dict]): The user and assistant messages to start the conversation with
+
+        Returns:
+            The forked chat, of the same class
+        """
+        forked = copy.copy(self)
+
+        # The OpenAI conversation starts with the system message
+        head = self.conversation[:1] if self.ai_provider == "openai" else []
+        forked.conversation = head + list(turns)
+        forked.conversation_manager = copy.copy(self.conversation_manager)
+
+        return forked
+
+    def build_request(
+        self, message: str, model: str, temperature: float, stream: bool
+    ) -> dict:
+        """
+        Add a message to the conversation and build the request sending it
+
+        Args:
+            message (str): The message to send
+            model (str): The model to use, the default model if None
+            temperature (float): The temperature, the configured one if None
+            stream (bool): Whether the response is streamed
+
+        Returns:
+            dict: The arguments of the request of the provider, including the model
+        """
+        self.conversation.append({"role": "user", "content": message})
+
+        request = dict(
+            model=model if model else self.default_model,
+            max_tokens=self.max_tokens,
+            temperature=temperature if temperature else self.temperature,
+        )
+
+        # Only send the part of the conversation that fits in the token budget
+        if self.ai_provider == "openai":
+            messages = self.conversation_manager.window(self.conversation)
+            request.update(
+                messages=messages, response_format={"type": "text"}, stream=stream
+            )
+
+            # Ask for the usage of streamed responses, and route to the prompt cache
+            if stream:
+                request["stream_options"] = {"include_usage": True}
+            if self.prompt_caching:
+                request["extra_body"] = {
+                    "prompt_cache_key": openai_prompt_cache_key(messages)
+                }
+        else:
+            messages = self.conversation_manager.window(self.conversation, self.system)
+            system = self.system
+            if self.prompt_caching:
+                system, messages = claude_cached_prompt(system, messages)
+            request.update(system=system, messages=messages)
+
+        return request
+
+    def parse_response(self, response) -> tuple[str, object]:
+        """
+        Get the text and usage of a response that wasn't streamed
+
+        Returns:
+            tuple: The text and the usage of the provider
+        """
+        if self.ai_provider == "openai":
+            return response.choices[0].message.content, response.usage
+
+        return response.content[0].text, response.usage
+
+    @staticmethod
+    def parse_openai_chunk(chunk) -> tuple[str | None, object]:
+        """
+        Get the delta and usage of a chunk of a streamed OpenAI response
+
+        Returns:
+            tuple: The text delta if any, and the usage sent in the last chunk
+        """
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        return delta, chunk.usage
+
+    def record_usage(self, usage):
+        """
+        Keep the token counts of the last response and add them to the run metrics
+        """
+        if self.ai_provider == "openai":
+            self.last_usage = openai_usage(usage)
+        else:
+            self.last_usage = claude_usage(usage)
+
+        metrics.add(**self.last_usage)
+        log.info(f"{self.provider_name} usage: {self.last_usage}")
+
+    def handle_error(
+        self, error: Exception, attempt: int, retry_delay: float
+    ) -> tuple[float, str | None]:
+        """
+        Decide how to go on after a failed attempt
+
+        Args:
+            error (Exception): The error of the attempt
+            attempt (int): The number of the attempt, from 1
+            retry_delay (float): The base delay between retries
+
+        Returns:
+            delay (float): The seconds to wait before the next attempt
+            error (str | None): The error to give up with, on the last attempt or an
+                unexpected error
+        """
+        last_attempt = attempt >= self.max_retries
+
+        if isinstance(error, RATE_LIMIT_ERRORS):
+            # Wait for the delay asked by the provider, or a jittered exponential backoff
+            delay = backoff_delay(
+                retry_delay, attempt, retry_after_seconds(error.response.headers)
+            )
+            if last_attempt:
+                log.error("Max retries reached for rate limit.")
+                return delay, "Max retries reached for rate limit."
+
+            log.warning(f"Rate limit error. Retrying in {delay:.1f}s...")
+            return delay, None
+
+        if isinstance(error, CONNECTION_ERRORS):
+            if last_attempt:
+                log.error("Max retries reached for connection errors.")
+                return 0, "Max retries reached for connection errors."
+
+            log.warning("API connection error. Retrying...")
+            return backoff_delay(retry_delay, attempt), None
+
+        if isinstance(error, API_ERRORS):
+            if last_attempt:
+                log.error("Max retries reached for API errors.")
+
+                # Handle overloaded API
+                if self.ai_provider == "claude" and "529" in str(error):
+                    return (
+                        0,
+                        "Max retries reached for API errors. Anthropic API seems to be overloaded right now, please try again later.",
+                    )
+
+                return (
+                    0,
+                    f"Max retries reached for API errors. Please check that your {self.provider_name} API key is correct.",
+                )
+
+            log.warning("API error. Retrying...")
+            log.debug(error)
+            return backoff_delay(retry_delay, attempt), None
+
+        # Any other exception isn't retried
+        log.error(f"Error sending message to {self.provider_name}: {error}")
+        return (
+            0,
+            f"An unexpected error occurred while getting the response from {self.provider_name}.",
+        )
+
+    def reply(self, content: str) -> tuple[str, None]:
+        """
+        Add a response to the conversation
+
+        Returns:
+            tuple: The response and no error
+        """
+        self.conversation.append({"role": "assistant", "content": content})
+        return content, None
+
+    def fail(self, error: str) -> tuple[str, str]:
+        """
+        Give up on a message
+
+        Returns:
+            tuple: An empty response and the error
+        """
+        log.error(f"Error sending message to {self.provider_name}: {error}")
+        return "", f"Error sending message to {self.provider_name}:\n\n{error}"
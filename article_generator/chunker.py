@@ -0,0 +1,129 @@
+import re
+
+from article_generator.conversation import count_tokens
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Rough number of words per token, to cut the texts without sentences
+WORDS_PER_TOKEN = 0.75
+
+
+def split_long_paragraph(paragraph: str, max_tokens: int) -> list[str]:
+    """
+    Split a paragraph over the budget on its sentences, or on its words
+    """
+    pieces = []
+
+    for sentence in SENTENCE_END.split(paragraph):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+
+        words = sentence.split()
+        step = max(1, int(max_tokens * WORDS_PER_TOKEN))
+        for i in range(0, len(words), step):
+            pieces.extend(halve_to_budget(" ".join(words[i : i + step]), max_tokens))
+
+    return pieces
+
+
+def halve_to_budget(text: str, max_tokens: int) -> list[str]:
+    """
+    Cut a text in halves until each fits in the budget, for the texts without
+    separators such as long URLs or encoded data
+    """
+    if len(text) < 2 or count_tokens(text) <= max_tokens:
+        return [text]
+
+    middle = len(text) // 2
+    return halve_to_budget(text[:middle], max_tokens) + halve_to_budget(
+        text[middle:], max_tokens
+    )
+
+
+def split_into_chunks(text: str, max_tokens: int) -> list[str]:
+    """
+    Split a text into chunks of at most max_tokens, cutting between paragraphs, or
+    between the sentences of the paragraphs too long to fit in a chunk
+
+    Args:
+        text (str): The text to split
+        max_tokens (int): The token budget of a chunk
+
+    Returns:
+        list[str]: The chunks, in order
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        tokens = count_tokens(paragraph)
+        pieces = [paragraph]
+        if tokens > max_tokens:
+            pieces = split_long_paragraph(paragraph, max_tokens)
+
+        for piece in pieces:
+            tokens = count_tokens(piece) if len(pieces) > 1 else tokens
+
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current = []
+                current_tokens = 0
+
+            current.append(piece)
+            current_tokens += tokens
+
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks
+
+
+def pack_texts(texts: list[str], max_tokens: int, fan_in: int) -> list[str]:
+    """
+    Group consecutive texts into the inputs of the next reduce level, each at most
+    fan_in texts and max_tokens
+
+    A group always takes at least two texts while there are two left, so every level
+    is smaller than the previous one even if the texts are over the budget.
+
+    Args:
+        texts (list[str]): The texts to group, e.g. the summaries of a level
+        max_tokens (int): The token budget of a group
+        fan_in (int): The maximum number of texts in a group
+
+    Returns:
+        list[str]: The groups, their texts separated by blank lines
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for text in texts:
+        tokens = count_tokens(text)
+
+        full = len(current) >= fan_in or current_tokens + tokens > max_tokens
+        if current and full and len(current) >= 2:
+            groups.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        # A single text left over joins the previous group
+        if len(current) == 1 and groups and len(texts) > 1:
+            groups[-1] = groups[-1] + "\n\n" + current[0]
+        else:
+            groups.append("\n\n".join(current))
+
+    return groups
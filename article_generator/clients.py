@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import weakref
+
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic, AsyncAnthropic
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# One pooled client per provider and API key, so the keep-alive connections are
+# reused across every AI instance of the process
+clients = {}
+clients_lock = threading.Lock()
+
+# Async clients are bound to the event loop they were first used in, so the process
+# keeps one pooled client per provider and API key for each running loop
+async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(ai_provider: str, api_key: str) -> OpenAI | Anthropic:
+    """
+    Get the shared client for a provider and API key
+
+    Args:
+        ai_provider (str): The AI provider, "openai" or "claude"
+        api_key (str): The API key of the provider
+
+    Returns:
+        OpenAI | Anthropic: The client
+    """
+    with clients_lock:
+        if (ai_provider, api_key) not in clients:
+            log.info(f"Creating {ai_provider} client...")
+
+            if ai_provider == "openai":
+                client = OpenAI(api_key=api_key)
+            elif ai_provider == "claude":
+                client = Anthropic(api_key=api_key)
+            else:
+                raise ValueError("Invalid AI provider")
+
+            clients[(ai_provider, api_key)] = client
+
+        return clients[(ai_provider, api_key)]
+
+
+def get_async_client(ai_provider: str, api_key: str) -> AsyncOpenAI | AsyncAnthropic:
+    """
+    Get the shared async client of the running event loop for a provider and API key
+
+    Args:
+        ai_provider (str): The AI provider, "openai" or "claude"
+        api_key (str): The API key of the provider
+
+    Returns:
+        AsyncOpenAI | AsyncAnthropic: The async client
+    """
+    with clients_lock:
+        loop_clients = async_clients.setdefault(asyncio.get_running_loop(), {})
+
+        if (ai_provider, api_key) not in loop_clients:
+            log.info(f"Creating async {ai_provider} client...")
+
+            if ai_provider == "openai":
+                client = AsyncOpenAI(api_key=api_key)
+            elif ai_provider == "claude":
+                client = AsyncAnthropic(api_key=api_key)
+            else:
+                raise ValueError("Invalid AI provider")
+
+            loop_clients[(ai_provider, api_key)] = client
+
+        return loop_clients[(ai_provider, api_key)]
+
+
+async def close_async_clients():
+    """
+    Close the async clients of the running event loop, before the loop is closed
+    """
+    with clients_lock:
+        loop_clients = async_clients.pop(asyncio.get_running_loop(), {})
+
+    for client in loop_clients.values():
+        await client.close()
+
+
+def invalidate_clients(params: dict, previous_params: dict | None):
+    """
+    Drop the clients of the API keys replaced in the saved params
+
+    The clients of other API keys, e.g. the per-request keys of the API jobs, are
+    kept. The dropped clients aren't closed, generations still using them finish
+    normally.
+
+    Args:
+        params (dict): The params that were just saved
+        previous_params (dict | None): The params they replaced
+    """
+    if not previous_params:
+        return
+
+    replaced_keys = {
+        (ai_provider, previous_params[f"{ai_provider}_params"]["api_key"])
+        for ai_provider in ("openai", "claude")
+        if previous_params[f"{ai_provider}_params"]["api_key"]
+        != params[f"{ai_provider}_params"]["api_key"]
+    }
+
+    with clients_lock:
+        for registry in [clients, *async_clients.values()]:
+            for key in replaced_keys & set(registry):
+                log.info(f"Dropping {key[0]} client after a credentials change")
+                del registry[key]
+
+
+ConfigManager.add_save_listener(invalidate_clients)
@@ -1,42 +1,435 @@
-from bs4 import BeautifulSoup
+import codecs
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
 import requests
 
+from article_generator.html_extractor import create_extractor
+from utils import metrics
+from utils.cache import DiskCache, get_cache
+from utils.generation_config import GenerationConfig
+from utils.http_session import get_session
 from logging_setup import setup_logger
 
 log = setup_logger(__name__)
 
+# The content types of the pages the text is extracted from
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+
+# The size of the pieces the pages are downloaded and parsed in
+CHUNK_SIZE = 16 * 1024
+
+# The bytes looked at for a <meta charset> before decoding, as browsers do
+PRESCAN_BYTES = 1024
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+class SkipPage(Exception):
+    """
+    Raised when a page is not worth downloading or extracting, with the reason
+    """
+
+
+class FetchStats:
+    """
+    Counts the pages fetched during a run and records why the others were skipped
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.skipped = {}
+
+    def record(self, url: str, reason: str = None):
+        with self.lock:
+            # The fetches still running after the deadline were already recorded
+            if url in self.skipped:
+                return
+
+            if reason:
+                self.skipped[url] = reason
+            else:
+                self.fetched += 1
+
+    def __str__(self) -> str:
+        with self.lock:
+            skipped = "".join(
+                f"\n  {url}: {reason}" for url, reason in self.skipped.items()
+            )
+            return f"{self.fetched} pages fetched, {len(self.skipped)} skipped{skipped}"
+
+
+def parse_content_type(value: str) -> tuple[str, str | None]:
+    """
+    Get the media type and charset of a Content-Type header
+
+    Returns:
+        tuple: The lowercase media type and the charset, if any
+    """
+    media_type, *params = value.split(";")
+    charset = None
+
+    for param in params:
+        name, _, param_value = param.partition("=")
+        if name.strip().lower() == "charset":
+            charset = param_value.strip().strip("\"'") or None
+
+    return media_type.strip().lower(), charset
+
+
+def sniff_charset(head: bytes) -> str | None:
+    """
+    Get the charset declared by the BOM or a <meta> tag at the start of a page
+
+    Args:
+        head (bytes): The first bytes of the page
+
+    Returns:
+        str | None: The charset, or None if the page doesn't declare one
+    """
+    for bom, charset in BOMS:
+        if head.startswith(bom):
+            return charset
+
+    match = META_CHARSET.search(head)
+    if match:
+        return match.group(1).decode("ascii", errors="ignore")
+
+    return None
+
+
+def incremental_decoder(charset: str | None):
+    """
+    Get a decoder for the charset, UTF-8 if it is missing or unknown
+    """
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def extract_response(
+    url: str,
+    response: requests.Response,
+    timeout: float,
+    max_bytes: int,
+    max_chars: int,
+    extractor: str,
+) -> str:
+    """
+    Stream the body of a response to the HTML extractor
+
+    The download stops as soon as the extractor has enough text, when max_bytes are
+    received or after timeout seconds, so a fetch never holds more than a chunk of
+    the page in memory.
+
+    Raises:
+        SkipPage: If the response is not an HTML page or is too large
+    """
+    media_type, charset = parse_content_type(response.headers.get("Content-Type", ""))
+    if media_type and media_type not in HTML_CONTENT_TYPES:
+        raise SkipPage(f"content type {media_type}")
+
+    content_length = response.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise SkipPage(f"too large ({content_length} bytes)")
+
+    page_extractor = create_extractor(extractor, max_chars)
+    decoder = None
+    pending = b""
+    received = 0
+    stop_at = time.monotonic() + timeout
+
+    for chunk in response.iter_content(CHUNK_SIZE):
+        received += len(chunk)
+        pending += chunk
+
+        # Decode from the charset of the headers, or the one declared in the page
+        if decoder is None:
+            if not charset and len(pending) < PRESCAN_BYTES:
+                continue
+            decoder = incremental_decoder(charset or sniff_charset(pending))
+
+        done = page_extractor.feed(decoder.decode(pending))
+        pending = b""
+
+        if done:
+            log.debug(f"Got enough text from {url} after {received} bytes")
+            return page_extractor.close()
+
+        if received >= max_bytes:
+            log.info(f"Stopped downloading {url} at {received} bytes")
+            return page_extractor.close()
+
+        if time.monotonic() > stop_at:
+            log.info(f"Stopped downloading {url} after {timeout}s")
+            return page_extractor.close()
+
+    if decoder is None:
+        decoder = incremental_decoder(charset or sniff_charset(pending))
+    page_extractor.feed(decoder.decode(pending, final=True))
+
+    return page_extractor.close()
+
+
+def fetch_content(
+    url: str,
+    timeout: float = 30,
+    use_cache: bool = True,
+    max_chars: int = 0,
+    extractor: str = "auto",
+    max_bytes: int = 2_000_000,
+    stats: FetchStats = None,
+) -> str:
+    """
+    Fetch the text of a page
+
+    Args:
+        url (str): The URL of the page
+        timeout (float): The maximum number of seconds to spend on the page
+        use_cache (bool): Whether to serve and store the page in the cache
+        max_chars (int): The maximum number of chars to extract, 0 for all
+        extractor (str): The HTML extractor, see html_extractor.create_extractor
+        max_bytes (int): The maximum number of bytes to download
+        stats (FetchStats): Records the page as fetched, or why it was skipped
+
+    Returns:
+        str: The text of the page, empty if it was skipped
+    """
+    cache = get_cache("pages") if use_cache else None
+    # The text depends on how the page is extracted, not only on the URL
+    cache_key = (
+        DiskCache.make_key(url, max_chars, extractor, max_bytes) if cache else None
+    )
+    headers = {}
+
+    # Serve the page from the cache, or revalidate it if it has expired
+    entry = cache.get_entry(cache_key) if cache else None
+    if entry:
+        if entry["expires_at"] >= time.time():
+            log.info(f"Serving content of {url} from the cache")
+            cache.record_hit()
+            metrics.add(cache_hits=1)
+            if stats:
+                stats.record(url)
+            return entry["value"]
+
+        if entry["meta"].get("etag"):
+            headers["If-None-Match"] = entry["meta"]["etag"]
+        if entry["meta"].get("last_modified"):
+            headers["If-Modified-Since"] = entry["meta"]["last_modified"]
 
-def fetch_content(url: str) -> str:
     # Fetch content from the URL
+    skip_reason = None
     try:
         log.info(f"Fetching content from {url}")
 
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()  # Raises an HTTPError if the status is 4xx, 5xx
-        soup = BeautifulSoup(response.text, "html.parser")
-        body = soup.find("body")
+        # The pooled session keeps the connections alive and retries transient errors
+        with get_session().get(
+            url, timeout=timeout, headers=headers, stream=True
+        ) as response:
+            if entry and headers and response.status_code == 304:
+                log.info(f"Content of {url} not modified, refreshing the cache")
+                cache.record_hit(revalidated=True)
+                metrics.add(cache_hits=1)
+                cache.set(cache_key, entry["value"], meta=entry["meta"])
+                if stats:
+                    stats.record(url)
+                return entry["value"]
+
+            if response.status_code >= 400:
+                raise SkipPage(f"HTTP {response.status_code}")
+
+            content_body = extract_response(
+                url, response, timeout, max_bytes, max_chars, extractor
+            )
 
-        if body:
-            content_body = body.get_text(separator="\n", strip=True)
-        else:
-            content_body = ""
+        if not content_body:
+            skip_reason = "no text"
+    except SkipPage as e:
+        skip_reason = str(e)
+        content_body = ""
     except Exception as e:
         log.warning(f"Failed to fetch content from {url}: {e}")
+        skip_reason = f"error ({type(e).__name__})"
         content_body = ""
 
+    if skip_reason:
+        log.info(f"Skipped {url}: {skip_reason}")
+        metrics.add(pages_skipped=1)
+        metrics.annotate(skipped=skip_reason)
+    if stats:
+        stats.record(url, skip_reason)
+
+    if cache:
+        cache.record_miss()
+
+        # Only cache successful fetches, failures are retried on the next run
+        if content_body:
+            cache.set(
+                cache_key,
+                content_body,
+                meta={
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                },
+            )
+
     return content_body
 
 
-def fetch_all_contents(urls: list[str]) -> tuple[list[str], str | None]:
+class HostLimiter:
+    """
+    Limits the number of concurrent connections to the same host
+    """
+
+    def __init__(self, per_host_limit: int):
+        self.per_host_limit = per_host_limit
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+
+            return self.semaphores[host]
+
+
+def fetch_all_contents(
+    urls: list[str],
+    max_workers: int = None,
+    per_host_limit: int = None,
+    deadline: float = None,
+    first_n: int = None,
+    use_cache: bool = True,
+    stats: FetchStats = None,
+    config: GenerationConfig = None,
+) -> tuple[list[str], str | None]:
+    """
+    Fetch the content of the URLs concurrently
+
+    Args:
+        urls (list[str]): The URLs to fetch, in SERP order
+        max_workers (int): The maximum number of concurrent fetches
+        per_host_limit (int): The maximum number of concurrent fetches per host
+        deadline (float): The maximum number of seconds to spend fetching
+        first_n (int): Stop as soon as this many pages have content (0 = fetch all)
+        use_cache (bool): Whether to serve and store the pages in the cache
+        stats (FetchStats): Records the pages fetched and why the others were skipped
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        contents (list[str]): The non empty contents, in SERP order
+        error (str | None): The error message if any
+    """
     log.info(f"Fetching content from {len(urls)} URLs...")
 
-    # Fetch content from multiple URLs
-    contents = [fetch_content(url) for url in urls]
+    # Load the fetch params, the arguments take precedence
+    fetch_config = (config or GenerationConfig.load())["fetch_params"]
+    timeout = fetch_config["timeout"]
+    max_chars = fetch_config["max_chars"]
+    max_bytes = fetch_config["max_bytes"]
+    extractor = fetch_config["extractor"]
+    max_workers = max_workers or fetch_config["max_workers"]
+    per_host_limit = per_host_limit or fetch_config["per_host_limit"]
+    deadline = deadline or fetch_config["deadline"]
+    first_n = first_n if first_n is not None else fetch_config["first_n"]
+
+    if not urls:
+        log.error("No content could be fetched from the URLs")
+        return [], "No content could be fetched from the URLs"
+
+    stats = stats or FetchStats()
+    host_limiter = HostLimiter(per_host_limit)
+    deadline_at = time.monotonic() + deadline
+
+    def fetch_with_limits(url: str) -> str:
+        remaining = deadline_at - time.monotonic()
+
+        # Wait for a free connection slot to the host, but never past the deadline
+        semaphore = host_limiter.get(url)
+        if remaining <= 0 or not semaphore.acquire(timeout=remaining):
+            log.warning(f"Deadline reached before fetching {url}")
+            stats.record(url, "deadline")
+            return ""
+
+        try:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                stats.record(url, "deadline")
+                return ""
+            with metrics.span("fetch", url=url):
+                return fetch_content(
+                    url,
+                    timeout=min(timeout, remaining),
+                    use_cache=use_cache,
+                    max_chars=max_chars,
+                    extractor=extractor,
+                    max_bytes=max_bytes,
+                    stats=stats,
+                )
+        finally:
+            semaphore.release()
+
+    # Fetch content from multiple URLs, keeping track of the SERP position
+    results = {}
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    futures = {
+        metrics.submit(executor, fetch_with_limits, url): index
+        for index, url in enumerate(urls)
+    }
+    pending = set(futures)
+
+    try:
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                log.warning(
+                    f"Fetch deadline of {deadline}s reached, {len(pending)} URLs skipped"
+                )
+                for future in pending:
+                    stats.record(urls[futures[future]], "deadline")
+                break
+
+            done, pending = wait(
+                pending, timeout=remaining, return_when=FIRST_COMPLETED
+            )
+
+            for future in done:
+                results[futures[future]] = future.result()
+
+            good_pages = sum(1 for content in results.values() if content)
+            if first_n and good_pages >= first_n:
+                log.info(f"Got {good_pages} pages, skipping {len(pending)} URLs")
+                for future in pending:
+                    stats.record(urls[futures[future]], "enough pages")
+                break
+    finally:
+        # Don't wait for the slow fetches, they are bounded by their own timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Remove empty contents, keeping the SERP order
+    contents = [results[index] for index in sorted(results) if results[index]]
+
+    if first_n:
+        contents = contents[:first_n]
 
-    # Remove empty contents
-    contents = [content for content in contents if content]
+    log.info(f"Fetched {len(contents)} contents, {stats}")
 
-    log.info(f"Fetched {len(contents)} contents")
+    cache = get_cache("pages") if use_cache else None
+    if cache:
+        log.info(f"Page cache stats: {cache.stats()}")
 
     if not contents:
         log.error("No content could be fetched from the URLs")
@@ -0,0 +1,105 @@
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Rough number of characters per token, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text, exactly with tiktoken if installed, or estimated
+
+    Args:
+        text (str): The text to count the tokens of
+
+    Returns:
+        int: The number of tokens
+    """
+    if tiktoken:
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def count_messages_tokens(messages: list[dict]) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+class ConversationManager:
+    """
+    Chooses which messages of a conversation are sent to the AI provider.
+
+    While the conversation fits in the token budget it is sent whole. Once it
+    doesn't, the earlier turns are dropped, keeping the pinned first turns (the
+    outline step) and a rolling window of the last turns. A turn is a user message
+    and the assistant reply to it.
+    """
+
+    def __init__(self, max_input_tokens: int, keep_last_turns: int, pinned_turns: int):
+        """
+        Args:
+            max_input_tokens (int): The token budget of a request, 0 to never compact
+            keep_last_turns (int): The number of most recent turns always kept
+            pinned_turns (int): The number of first turns always kept
+        """
+        self.max_input_tokens = max_input_tokens
+        self.keep_last_turns = keep_last_turns
+        self.pinned_turns = pinned_turns
+
+        # The input tokens of the last window, before and after compaction
+        self.last_input_tokens = 0
+        self.last_full_input_tokens = 0
+
+    def window(self, conversation: list[dict], system: str = "") -> list[dict]:
+        """
+        Get the messages to send for the conversation
+
+        Args:
+            conversation (list[dict]): The whole conversation, ending with the new user message
+            system (str): The system prompt, if it is sent apart from the messages
+
+        Returns:
+            list[dict]: The messages to send
+        """
+        system_tokens = count_tokens(system) if system else 0
+        full_tokens = system_tokens + count_messages_tokens(conversation)
+        self.last_full_input_tokens = full_tokens
+        self.last_input_tokens = full_tokens
+
+        if not self.max_input_tokens or full_tokens <= self.max_input_tokens:
+            return conversation
+
+        # Split the conversation into the leading system message, the turns and the new message
+        head = [m for m in conversation[:1] if m["role"] == "system"]
+        body = conversation[len(head) : -1]
+        turns = [body[i : i + 2] for i in range(0, len(body), 2)]
+
+        pinned = turns[: self.pinned_turns]
+        rest = turns[self.pinned_turns :]
+
+        # Slice from the start, [-0:] would keep every turn
+        recent = rest[max(len(rest) - self.keep_last_turns, 0) :]
+        dropped = len(turns) - len(pinned) - len(recent)
+
+        if dropped <= 0:
+            return conversation
+
+        messages = head
+        for turn in pinned + recent:
+            messages = messages + turn
+        messages = messages + conversation[-1:]
+
+        self.last_input_tokens = system_tokens + count_messages_tokens(messages)
+
+        log.info(
+            f"Compacted the conversation, dropped {dropped} turns: "
+            f"{full_tokens} -> {self.last_input_tokens} input tokens"
+        )
+
+        return messages
@@ -0,0 +1,377 @@
+import re
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Elements that never hold main content
+SKIPPED_TAGS = {
+    "head",
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "nav",
+    "footer",
+    "aside",
+    "form",
+    "button",
+    "select",
+    "dialog",
+}
+
+# Elements skipped outside the main content only, the header of an article holds its
+# title and standfirst
+PAGE_TAGS = {"header"}
+
+# Elements skipped when their class, id or role look like boilerplate. Only container
+# elements are checked, they are closed explicitly even in sloppy HTML.
+CONTAINER_TAGS = {"div", "section", "ul", "ol", "table", "figure", "span"}
+
+# The elements holding the main content when the page marks it
+MAIN_TAGS = {"article", "main"}
+
+# The boilerplate class and id names of Mozilla's Readability
+UNLIKELY_CANDIDATES = re.compile(
+    r"-ad-|ai2html|banner|breadcrumbs|combx|comment|community|cover-wrap|disqus|"
+    r"extra|footer|gdpr|header|legends|menu|related|remark|replies|rss|shoutbox|"
+    r"sidebar|skyscraper|social|sponsor|supplemental|ad-break|agegate|pagination|"
+    r"pager|popup|yom-remote|cookie|newsletter|share|subscribe",
+    re.IGNORECASE,
+)
+MAYBE_CANDIDATE = re.compile(
+    r"and|article|body|column|content|main|shadow", re.IGNORECASE
+)
+BOILERPLATE_ROLES = {
+    "navigation",
+    "banner",
+    "contentinfo",
+    "complementary",
+    "menu",
+    "menubar",
+    "dialog",
+    "alert",
+    "search",
+}
+
+# The main content is preferred over the whole page text once it has this many chars
+MIN_MAIN_CHARS = 500
+
+# How much page text to read past max_chars looking for the main content
+LOOKAHEAD = 4
+
+# The size of the pieces the HTML is fed to the parser in, to stop parsing early
+CHUNK_SIZE = 16 * 1024
+
+
+def is_boilerplate(tag: str, attrs: dict) -> bool:
+    """
+    Check if an element looks like navigation, ads, comments or other boilerplate
+
+    Args:
+        tag (str): The tag name, lowercase
+        attrs (dict): The attributes of the element
+
+    Returns:
+        bool: Whether to skip the element and its content
+    """
+    if tag not in CONTAINER_TAGS:
+        return False
+
+    if attrs.get("role") in BOILERPLATE_ROLES:
+        return True
+    if "hidden" in attrs or attrs.get("aria-hidden") == "true":
+        return True
+
+    match_string = f"{attrs.get('class') or ''} {attrs.get('id') or ''}"
+    return bool(
+        UNLIKELY_CANDIDATES.search(match_string)
+        and not MAYBE_CANDIDATE.search(match_string)
+    )
+
+
+class TextCollector:
+    """
+    Collects the text of a page from its parse events, skipping boilerplate, and
+    keeps the text of the article or main element apart from the whole text
+    """
+
+    def __init__(self, max_chars: int = 0):
+        """
+        Args:
+            max_chars (int): Stop collecting once this much main text is found, 0 for all
+        """
+        self.max_chars = max_chars
+
+        # The skipped element being parsed, and how many of its tag are open
+        self.skip_tag = None
+        self.skip_depth = 0
+
+        self.main_depth = 0
+        self.buffer = []
+        self.texts = []
+        self.main_texts = []
+        self.length = 0
+        self.main_length = 0
+        self.done = False
+
+    def start(self, tag: str, attrs: dict):
+        self.flush()
+        tag = tag.lower()
+
+        # A head left open ends where the body starts
+        if tag == "body" and self.skip_tag == "head":
+            self.skip_tag = None
+
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+            return
+
+        if (
+            tag in SKIPPED_TAGS
+            or (tag in PAGE_TAGS and not self.main_depth)
+            or is_boilerplate(tag, attrs)
+        ):
+            self.skip_tag = tag
+            self.skip_depth = 1
+            return
+
+        if tag in MAIN_TAGS:
+            self.main_depth += 1
+
+    def end(self, tag: str):
+        self.flush()
+        tag = tag.lower()
+
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if not self.skip_depth:
+                    self.skip_tag = None
+            return
+
+        if tag in MAIN_TAGS and self.main_depth:
+            self.main_depth -= 1
+
+    def data(self, text: str):
+        # A text can come in several pieces, e.g. split at its entities
+        if not self.skip_tag and not self.done:
+            self.buffer.append(text)
+
+    def flush(self):
+        """
+        Add the text buffered since the last tag
+        """
+        if not self.buffer:
+            return
+
+        text = "".join(self.buffer).strip()
+        self.buffer = []
+        if not text:
+            return
+
+        self.texts.append(text)
+        self.length += len(text) + 1
+
+        if self.main_depth:
+            self.main_texts.append(text)
+            self.main_length += len(text) + 1
+
+        if self.max_chars and (
+            self.main_length >= self.max_chars
+            or self.length >= self.max_chars * LOOKAHEAD
+        ):
+            self.done = True
+
+    def close(self) -> str:
+        """
+        Get the collected text
+
+        Returns:
+            str: The main text if the page has enough of it, or the whole text
+        """
+        self.flush()
+        min_main_chars = min(self.max_chars or MIN_MAIN_CHARS, MIN_MAIN_CHARS)
+        texts = self.main_texts if self.main_length >= min_main_chars else self.texts
+        text = "\n".join(texts)
+
+        return text[: self.max_chars] if self.max_chars else text
+
+
+class HTMLExtractor(ABC):
+    """
+    Extracts the text of a page fed to it in pieces, as it is downloaded
+    """
+
+    def __init__(self, max_chars: int = 0):
+        """
+        Args:
+            max_chars (int): The maximum number of chars to extract, 0 for all
+        """
+        self.max_chars = max_chars
+
+    @abstractmethod
+    def feed(self, html: str) -> bool:
+        """
+        Parse the next piece of the page
+
+        Args:
+            html (str): The piece of HTML
+
+        Returns:
+            bool: Whether enough text was extracted and the rest of the page can be skipped
+        """
+
+    @abstractmethod
+    def close(self) -> str:
+        """
+        Finish the parsing
+
+        Returns:
+            str: The extracted text
+        """
+
+
+class StdlibExtractor(HTMLExtractor):
+    """
+    Streaming extractor on the pure-Python html.parser of the standard library
+    """
+
+    class Parser(HTMLParser):
+        def __init__(self, collector: TextCollector):
+            super().__init__(convert_charrefs=True)
+            self.collector = collector
+
+        def handle_starttag(self, tag, attrs):
+            self.collector.start(tag, dict(attrs))
+
+        def handle_startendtag(self, tag, attrs):
+            self.collector.flush()
+
+        def handle_endtag(self, tag):
+            self.collector.end(tag)
+
+        def handle_data(self, data):
+            self.collector.data(data)
+
+    def __init__(self, max_chars: int = 0):
+        super().__init__(max_chars)
+        self.collector = TextCollector(max_chars)
+        self.parser = self.Parser(self.collector)
+
+    def feed(self, html: str) -> bool:
+        if not self.collector.done:
+            self.parser.feed(html)
+        return self.collector.done
+
+    def close(self) -> str:
+        if not self.collector.done:
+            self.parser.close()
+        return self.collector.close()
+
+
+class LxmlExtractor(HTMLExtractor):
+    """
+    Streaming extractor on the libxml2 HTML parser of lxml, sending its parse events
+    to the collector without building a tree
+    """
+
+    def __init__(self, max_chars: int = 0):
+        super().__init__(max_chars)
+        self.collector = TextCollector(max_chars)
+        self.parser = etree.HTMLParser(target=self.collector, recover=True)
+
+    def feed(self, html: str) -> bool:
+        if not self.collector.done:
+            self.parser.feed(html)
+        return self.collector.done
+
+    def close(self) -> str:
+        # Closing frees the parser context, also when it stopped early
+        return self.parser.close()
+
+
+class BeautifulSoupExtractor(HTMLExtractor):
+    """
+    The whole body text of the page, parsed at once with BeautifulSoup
+    """
+
+    def __init__(self, max_chars: int = 0):
+        super().__init__(max_chars)
+        self.pieces = []
+
+    def feed(self, html: str) -> bool:
+        self.pieces.append(html)
+        return False
+
+    def close(self) -> str:
+        soup = BeautifulSoup("".join(self.pieces), "html.parser")
+        body = soup.find("body")
+        text = body.get_text(separator="\n", strip=True) if body else ""
+
+        return text[: self.max_chars] if self.max_chars else text
+
+
+EXTRACTORS = {
+    "lxml": LxmlExtractor,
+    "html.parser": StdlibExtractor,
+    "bs4": BeautifulSoupExtractor,
+}
+
+
+def create_extractor(name: str = "auto", max_chars: int = 0) -> HTMLExtractor:
+    """
+    Create an extractor for a page
+
+    Args:
+        name (str): "lxml", "html.parser", "bs4", or "auto" for lxml when installed
+        max_chars (int): The maximum number of chars to extract, 0 for all
+
+    Returns:
+        HTMLExtractor: The extractor
+    """
+    if name == "auto":
+        name = "lxml" if etree else "html.parser"
+
+    if name == "lxml" and not etree:
+        log.warning("lxml is not installed, extracting the text with html.parser")
+        name = "html.parser"
+
+    if name not in EXTRACTORS:
+        raise ValueError(f"Invalid HTML extractor: {name}")
+
+    return EXTRACTORS[name](max_chars)
+
+
+def extract_text(html: str, max_chars: int = 0, extractor: str = "auto") -> str:
+    """
+    Extract the main text of a page, parsing only as much of it as needed
+
+    Args:
+        html (str): The page
+        max_chars (int): The maximum number of chars to extract, 0 for all
+        extractor (str): The extractor to use, see create_extractor
+
+    Returns:
+        str: The text
+    """
+    page_extractor = create_extractor(extractor, max_chars)
+
+    for start in range(0, len(html), CHUNK_SIZE):
+        if page_extractor.feed(html[start : start + CHUNK_SIZE]):
+            break
+
+    return page_extractor.close()
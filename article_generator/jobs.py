@@ -0,0 +1,276 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from article_generator.article_generator import ArticleGenerator
+from article_generator.progress import ProgressReporter
+from utils.config_manager import ConfigManager
+from utils.generation_config import GenerationConfig
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while max_queued jobs are already waiting
+    """
+
+
+# The job manager of the process, shared by every session of the UI
+job_manager = None
+job_manager_lock = threading.Lock()
+
+FINISHED_STATUSES = ("complete", "failed")
+
+
+class Job:
+    """
+    A generation submitted to the worker pool, with the progress it reported so far
+    """
+
+    def __init__(
+        self,
+        article_params: dict,
+        run_id: str = None,
+        use_cache: bool = True,
+        overrides: dict = None,
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.article_params = article_params
+        self.use_cache = use_cache
+        self.overrides = overrides or {}
+
+        # Notified on every change, for the clients streaming the progress
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+
+        self.status = "queued"
+        self.progress = 0.0
+        self.progress_text = "Queued"
+        self.status_texts = []
+        self.step_texts = {}
+        self.result = ""
+        self.error = None
+
+        # The run to resume, then the run of the generation once it starts
+        self.run_id = run_id
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def update(self, **fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.notify()
+
+    def notify(self):
+        # Called with the lock held
+        self.version += 1
+        self.changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        Wait until the job changes after a version, or the timeout
+
+        Args:
+            version (int): The version of the last snapshot seen
+            timeout (float): The maximum number of seconds to wait
+
+        Returns:
+            int: The current version
+        """
+        with self.lock:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self) -> dict:
+        """
+        Get a consistent copy of the state of the job
+
+        Returns:
+            dict: The status, progress, texts and result of the job
+        """
+        with self.lock:
+            return {
+                "id": self.id,
+                "version": self.version,
+                "status": self.status,
+                "progress": self.progress,
+                "progress_text": self.progress_text,
+                "status_texts": list(self.status_texts),
+                "step_texts": dict(self.step_texts),
+                "result": self.result,
+                "error": self.error,
+                "run_id": self.run_id,
+                "article_params": dict(self.article_params),
+                "overrides": self.overrides,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobProgressReporter(ProgressReporter):
+    """
+    Records the progress events of a generation in its job, for the clients polling it
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def status(self, text: str):
+        with self.job.lock:
+            self.job.status_texts.append(text)
+            self.job.notify()
+
+    def progress(self, value: float, text: str):
+        self.job.update(progress=min(value, 1.0), progress_text=text)
+
+    def step_text(self, step: int, text: str):
+        with self.job.lock:
+            self.job.step_texts[step] = text
+            self.job.notify()
+
+
+class JobManager:
+    """
+    Runs the generations on a pool of worker threads, so the clients submitting them
+    only poll their status and results by job id
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        keep_seconds: float,
+        max_queued: int = 0,
+        generator_factory=ArticleGenerator,
+    ):
+        """
+        Args:
+            max_workers (int): The number of generations running at the same time
+            keep_seconds (float): How long the finished jobs are kept for the clients
+            max_queued (int): The number of jobs waiting for a worker, 0 for no limit
+            generator_factory (Callable[[dict, GenerationConfig], ArticleGenerator]):
+                Creates the generator of a job from its article params and config,
+                e.g. a stub in tests
+        """
+        self.keep_seconds = keep_seconds
+        self.max_queued = max_queued
+        self.generator_factory = generator_factory
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="generation"
+        )
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(
+        self,
+        article_params: dict,
+        run_id: str = None,
+        use_cache: bool = True,
+        overrides: dict = None,
+    ) -> Job:
+        """
+        Queue a generation
+
+        Args:
+            article_params (dict): The article params of the generation
+            run_id (str): A failed run to resume, see ArticleGenerator.generate
+            use_cache (bool): Whether to reuse the cached search results, pages and summaries
+            overrides (dict): Params overridden for this generation only, e.g. the AI
+                provider, nested like the params
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        self.prune()
+
+        job = Job(
+            dict(article_params),
+            run_id=run_id,
+            use_cache=use_cache,
+            overrides=overrides,
+        )
+        with self.lock:
+            queued = sum(job.status == "queued" for job in self.jobs.values())
+            if self.max_queued and queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs are already queued")
+
+            self.jobs[job.id] = job
+
+        self.executor.submit(self.run, job)
+        log.info(
+            f"Queued job {job.id} for keyphrase: {article_params.get('keyphrase')}"
+        )
+
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def run(self, job: Job):
+        job.update(status="running", started_at=time.time(), progress_text="Starting")
+        log.info(f"Running job {job.id}")
+
+        article_generator = None
+        try:
+            # The params are read when the job starts, with the overrides of the job
+            config = GenerationConfig.load(job.overrides)
+            article_generator = self.generator_factory(job.article_params, config)
+            article, error = article_generator.generate(
+                JobProgressReporter(job), use_cache=job.use_cache, run_id=job.run_id
+            )
+        except Exception as e:
+            log.exception(f"Unexpected error in job {job.id}")
+            article, error = "", f"Unexpected error: {e}"
+
+        job.update(
+            status="failed" if error else "complete",
+            result=article,
+            error=error,
+            run_id=getattr(article_generator, "run_id", None) or job.run_id,
+            finished_at=time.time(),
+        )
+        log.info(f"Job {job.id} {job.status}")
+
+    def prune(self):
+        """
+        Forget the jobs finished more than keep_seconds ago
+        """
+        now = time.time()
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if job.finished and now - job.finished_at > self.keep_seconds:
+                    del self.jobs[job_id]
+
+
+def get_job_manager() -> JobManager:
+    """
+    Get the job manager of the process, created on first use
+
+    Returns:
+        JobManager: The job manager
+    """
+    global job_manager
+
+    with job_manager_lock:
+        if job_manager is None:
+            job_config = ConfigManager().load_params()["job_params"]
+            job_manager = JobManager(
+                job_config["max_workers"], job_config["keep_seconds"]
+            )
+
+        return job_manager
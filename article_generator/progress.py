@@ -0,0 +1,50 @@
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+
+class ProgressReporter:
+    """
+    Receives the progress events of a generation. The base class ignores them.
+    """
+
+    def status(self, text: str):
+        """
+        Report what the generation is doing
+
+        Args:
+            text (str): The status message
+        """
+
+    def progress(self, value: float, text: str):
+        """
+        Report how far along the generation is
+
+        Args:
+            value (float): The progress, from 0 to 1
+            text (str): The progress message
+        """
+
+    def step_text(self, step: int, text: str):
+        """
+        Report the article text generated so far by a step, as it streams in
+
+        Args:
+            step (int): The index of the step
+            text (str): The text generated so far
+        """
+
+
+class LoggingProgressReporter(ProgressReporter):
+    """
+    Logs the progress events, for headless generations
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = f"[{prefix}] " if prefix else ""
+
+    def status(self, text: str):
+        log.info(f"{self.prefix}{text}")
+
+    def progress(self, value: float, text: str):
+        log.info(f"{self.prefix}{value:.0%} - {text}")
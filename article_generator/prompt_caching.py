@@ -0,0 +1,101 @@
+import hashlib
+
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def claude_cached_prompt(system: str, messages: list[dict]) -> tuple:
+    """
+    Mark the system prompt and the conversation prefix as cacheable for Claude
+
+    The system prompt (with the content summary and brand fields) is the same on every
+    step, and the turns before the new message are the same as in the previous
+    request, so both are cache breakpoints. The conversation itself is not modified.
+
+    Args:
+        system (str): The system prompt
+        messages (list[dict]): The messages to send, ending with the new user message
+
+    Returns:
+        tuple: The system blocks and messages to send
+    """
+    if system:
+        system = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+
+    if len(messages) > 1 and messages[-2]["content"]:
+        prefix_end = messages[-2]
+        messages = messages[:-2] + [
+            {
+                "role": prefix_end["role"],
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prefix_end["content"],
+                        "cache_control": CACHE_CONTROL,
+                    }
+                ],
+            },
+            messages[-1],
+        ]
+
+    return system, messages
+
+
+def openai_prompt_cache_key(messages: list[dict]) -> str:
+    """
+    Get the key routing the requests sharing a system prompt to the same OpenAI cache
+
+    OpenAI caches prompt prefixes automatically, so the messages are always sent with
+    the system prompt first and the turns in their original order.
+
+    Args:
+        messages (list[dict]): The messages to send, starting with the system message
+
+    Returns:
+        str: The prompt cache key
+    """
+    return hashlib.sha256(messages[0]["content"].encode("utf-8")).hexdigest()[:32]
+
+
+def openai_usage(usage) -> dict:
+    """
+    Get the token counts of an OpenAI response
+
+    Returns:
+        dict: The input (including cached), output, cache read and cache write tokens
+    """
+    if usage is None:
+        return {}
+
+    details = getattr(usage, "prompt_tokens_details", None)
+
+    return {
+        "input_tokens": usage.prompt_tokens,
+        "output_tokens": usage.completion_tokens,
+        "cache_read_tokens": (getattr(details, "cached_tokens", 0) or 0),
+        "cache_write_tokens": 0,
+    }
+
+
+def claude_usage(usage) -> dict:
+    """
+    Get the token counts of a Claude response
+
+    Returns:
+        dict: The input (including cached), output, cache read and cache write tokens
+    """
+    if usage is None:
+        return {}
+
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_write_tokens = getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+    return {
+        "input_tokens": usage.input_tokens + cache_read_tokens + cache_write_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_read_tokens": cache_read_tokens,
+        "cache_write_tokens": cache_write_tokens,
+    }
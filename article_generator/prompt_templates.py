@@ -0,0 +1,149 @@
+import string
+import threading
+
+from utils.config_manager import ConfigManager, file_signature
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The variables the system prompt and the step prompts can use
+PROMPT_VARIABLES = frozenset(
+    [
+        "language",
+        "expertise_field",
+        "keyphrase",
+        "product_name",
+        "product_description",
+        "product_url",
+        "combined_content_summary",
+    ]
+)
+
+
+class PromptTemplate:
+    """
+    A prompt parsed once into its literal text and placeholders, so rendering it is
+    a join of the parts with the variable values
+    """
+
+    def __init__(self, name: str, text: str):
+        """
+        Args:
+            name (str): The name of the template in the error messages, e.g. "guide step 3"
+            text (str): The template, with {variable} placeholders and {{ }} for braces
+
+        Raises:
+            ValueError: If the template is malformed or uses an unknown variable
+        """
+        self.name = name
+        self.parts = []
+
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise ValueError(f"Invalid prompt template {name}: {e}") from e
+
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None:
+                if field not in PROMPT_VARIABLES:
+                    raise ValueError(
+                        f"Unknown placeholder {{{field}}} in prompt template {name}"
+                    )
+                if format_spec or conversion:
+                    raise ValueError(
+                        f"Placeholder {{{field}}} in prompt template {name} can't have a "
+                        f"format spec or conversion"
+                    )
+
+            self.parts.append((literal, field))
+
+        self.variables = {field for _, field in self.parts if field is not None}
+
+    def render(self, variables: dict) -> str:
+        """
+        Fill in the placeholders
+
+        Args:
+            variables (dict): The value of each variable of the template
+
+        Returns:
+            str: The prompt
+        """
+        pieces = []
+        for literal, field in self.parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(variables[field]))
+
+        return "".join(pieces)
+
+
+def compile_prompts(prompts: dict) -> dict:
+    """
+    Compile the templates of every article type
+
+    Args:
+        prompts (dict): The prompts file
+
+    Returns:
+        dict: Per article type, the system prompt template and the steps, each with
+            its printout, enhanced and depends_on fields and its prompt template
+
+    Raises:
+        ValueError: If a template is malformed or uses an unknown variable
+    """
+    compiled = {}
+
+    for article_type, config in prompts.items():
+        compiled[article_type] = {
+            "system_prompt": PromptTemplate(
+                f"{article_type} system prompt", "\n".join(config["system_prompt"])
+            ),
+            "steps": [
+                {
+                    "printout": step["printout"],
+                    "enhanced": step["enhanced"],
+                    "template": PromptTemplate(
+                        f"{article_type} step {index + 1}", "\n".join(step["prompt"])
+                    ),
+                    "depends_on": step.get("depends_on"),
+                }
+                for index, step in enumerate(config["steps"])
+            ],
+        }
+
+    return compiled
+
+
+# The compiled templates of the process, with the signature of the prompts file
+compiled_prompts = None
+compiled_prompts_lock = threading.Lock()
+
+
+def get_prompt_templates() -> dict:
+    """
+    Get the compiled templates of every article type, compiled again only when the
+    prompts file changes
+
+    Returns:
+        dict: The compiled templates per article type, shared, not to be modified
+
+    Raises:
+        ValueError: If a template is malformed or uses an unknown variable
+    """
+    global compiled_prompts
+
+    config_manager = ConfigManager()
+    signature = file_signature(
+        config_manager.base_dir / "article_generator" / "prompts.json"
+    )
+
+    with compiled_prompts_lock:
+        if compiled_prompts is None or compiled_prompts[0] != signature:
+            log.info("Compiling prompt templates...")
+            compiled_prompts = (
+                signature,
+                compile_prompts(config_manager.load_prompts()),
+            )
+
+        return compiled_prompts[1]
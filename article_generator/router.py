@@ -0,0 +1,449 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+
+from article_generator.ai_chat import AI
+from article_generator.async_ai_chat import AsyncAI
+from utils import metrics
+from utils.generation_config import GenerationConfig
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The stages of a generation that can be routed to their own providers and models
+STAGES = ["summary", "step"]
+
+# The owner of a stream once a route has won, no other route streams after it
+CLOSED = ("closed", "")
+
+
+def stage_routes(config: GenerationConfig, stage: str) -> list[tuple[str, str]]:
+    """
+    Get the providers and models a stage is sent to, in fallback order
+
+    The routes are "provider:model" strings, or "provider" for the default model of
+    the provider. A stage without routes uses the AI provider of the config.
+
+    Args:
+        config (GenerationConfig): The params of the generation
+        stage (str): One of STAGES
+
+    Returns:
+        list[tuple[str, str]]: The provider and model of each route
+    """
+    routes = []
+    for route in config["routing_params"]["stages"].get(stage) or ():
+        ai_provider, _, model = route.partition(":")
+        routes.append(
+            (ai_provider, model or config[f"{ai_provider}_params"]["default_model"])
+        )
+
+    return routes or [(config.ai_provider, config.provider_params["default_model"])]
+
+
+class RouteHealth:
+    """
+    Process-wide circuit breaker of the routes: a route failing, or answering slower
+    than the latency threshold, error_threshold times in a row is skipped for the
+    cooldown, so the requests go straight to its fallbacks during a provider incident
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.open_until = {}
+
+    def allows(self, route: tuple[str, str]) -> bool:
+        with self.lock:
+            return time.monotonic() >= self.open_until.get(route, 0)
+
+    def record(self, route: tuple[str, str], ok: bool, routing_config: dict):
+        with self.lock:
+            if ok:
+                self.failures[route] = 0
+                return
+
+            self.failures[route] = self.failures.get(route, 0) + 1
+            if self.failures[route] >= routing_config["error_threshold"]:
+                self.failures[route] = 0
+                self.open_until[route] = time.monotonic() + routing_config["cooldown"]
+                log.warning(
+                    f"Skipping {':'.join(route)} for {routing_config['cooldown']}s "
+                    "after repeated failures"
+                )
+
+
+route_health = RouteHealth()
+
+
+class RouteStream:
+    """
+    Streams the response of the first route to send a delta. The deltas are sent
+    with the lock held, so once a route has won and the stream is closed, none of
+    the losing routes still running can send one.
+    """
+
+    def __init__(self, on_delta: Callable[[str, str], None] = None):
+        self.on_delta = on_delta
+        self.lock = threading.Lock()
+        self.owner = None
+
+    def for_route(self, route: tuple[str, str]) -> Callable[[str, str], None] | None:
+        """
+        Get the on_delta callback of a route, None if the response isn't streamed
+        """
+        if not self.on_delta:
+            return None
+
+        def on_route_delta(delta: str, text: str):
+            with self.lock:
+                if self.owner is None:
+                    self.owner = route
+                if self.owner == route:
+                    self.on_delta(delta, text)
+
+        return on_route_delta
+
+    def release(self, route: tuple[str, str]):
+        """
+        Let another route stream after this one failed
+        """
+        with self.lock:
+            if self.owner == route:
+                self.owner = None
+
+    def close(self, route: tuple[str, str], response: str):
+        """
+        Close the stream on the winning route, its response replacing what another
+        route streamed
+        """
+        with self.lock:
+            if self.on_delta and self.owner != route:
+                self.on_delta(response, response)
+            self.owner = CLOSED
+
+
+class RoutedAI:
+    """
+    A chat sent to the routes of a stage: the first route that allows requests gets
+    each message, the next ones take over when it fails, or when it is still running
+    after hedge_after seconds, the first response wins.
+
+    Has the interface of AI used by the generation: chat, fork, conversation,
+    conversation_manager and last_usage.
+    """
+
+    # The chat of each route
+    chat_class = AI
+
+    def __init__(
+        self, system_prompt: str, config: GenerationConfig, routes: list[tuple]
+    ):
+        """
+        Args:
+            system_prompt (str): The system prompt of the conversation
+            config (GenerationConfig): The params of the generation
+            routes (list[tuple]): The provider and model of each route, in order
+        """
+        self.system_prompt = system_prompt
+        self.config = config
+        self.routing_config = config["routing_params"]
+        self.routes = routes
+
+        # The chat of each route, shared by the forks, created on first use
+        self.chats = {}
+        self.chats_lock = threading.Lock()
+
+        # The turns of the conversation, in the format of every provider
+        self.conversation = []
+
+        # Fail early on an invalid primary route, like AI
+        primary = self.get_chat(routes[0])
+        self.ai_provider = primary.ai_provider
+        self.default_model = primary.default_model
+        self.temperature = primary.temperature
+        self.conversation_manager = primary.conversation_manager
+        self.last_usage = {}
+        self.last_route = None
+
+    def get_chat(self, route: tuple[str, str]) -> AI | AsyncAI:
+        with self.chats_lock:
+            if route not in self.chats:
+                ai_provider, model = route
+                provider_overrides = {"default_model": model}
+
+                # Fail over to the next route instead of retrying for long
+                if len(self.routes) > 1:
+                    provider_overrides["max_retries"] = self.routing_config[
+                        "max_retries"
+                    ]
+
+                config = self.config.replace(
+                    {
+                        "ai_provider": ai_provider,
+                        f"{ai_provider}_params": provider_overrides,
+                    }
+                )
+                self.chats[route] = self.chat_class(self.system_prompt, config)
+
+            return self.chats[route]
+
+    def fork(self, turns: list[dict]) -> "RoutedAI":
+        """
+        Create a chat sharing the routes, with its own conversation
+
+        Args:
+            turns (list[dict]): The user and assistant messages to start the conversation with
+
+        Returns:
+            RoutedAI: The forked chat, of the same class
+        """
+        forked = object.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked.conversation = list(turns)
+        forked.last_usage = {}
+        forked.last_route = None
+        return forked
+
+    def candidates(self, model: str = None) -> list[tuple[str, str]]:
+        """
+        Get the routes to send a message to, in order
+
+        Args:
+            model (str): The model of the first route, its default model if None
+
+        Returns:
+            list[tuple[str, str]]: The routes
+        """
+        routes = list(self.routes)
+        if model:
+            routes[0] = (routes[0][0], model)
+
+        # The routes of a provider incident are skipped, unless every route is
+        candidates = [route for route in routes if route_health.allows(route)]
+        return candidates or routes
+
+    def record(self, route: tuple[str, str], error: str | None, elapsed: float):
+        route_health.record(
+            route,
+            not error and elapsed <= self.routing_config["latency_threshold"],
+            self.routing_config,
+        )
+
+    def chat(
+        self,
+        message: str,
+        model: str = None,
+        temperature: float = None,
+        retry_delay: int = 5,
+        on_delta: Callable[[str, str], None] = None,
+    ) -> tuple[str, str | None]:
+        """
+        Send a message to the routes, see AI.chat
+
+        Args:
+            message (str): The message to send
+            model (str): The model of the first route, its default model if None
+            temperature (float): The temperature for the response
+            retry_delay (int): The delay between retries
+            on_delta (Callable): Streams the response, called with each delta and the text so far
+
+        Returns:
+            response (str): The response of the first route to answer
+            error (str | None): The error of the last route if none answered
+        """
+        candidates = self.candidates(model)
+        hedge_after = self.routing_config["hedge_after"] or None
+        stream = RouteStream(on_delta)
+
+        def attempt(route):
+            chat = self.get_chat(route).fork(self.conversation)
+            start = time.perf_counter()
+            response, error = chat.chat(
+                message,
+                temperature=temperature,
+                retry_delay=retry_delay,
+                on_delta=stream.for_route(route),
+            )
+            self.record(route, error, time.perf_counter() - start)
+            return response, error, chat
+
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        running = {}
+        next_route = 0
+        error = None
+
+        try:
+            while True:
+                # Start the next route when nothing runs, e.g. after a failure, or
+                # as a hedge of the slow ones
+                if next_route < len(candidates) and (
+                    not running or hedge_after is not None
+                ):
+                    route = candidates[next_route]
+                    if running:
+                        log.info(f"Hedging the request on {':'.join(route)}")
+                        metrics.add(hedges=1)
+                    running[metrics.submit(executor, attempt, route)] = route
+                    next_route += 1
+
+                if not running:
+                    break
+
+                more = next_route < len(candidates)
+                done, _ = wait(
+                    running,
+                    timeout=hedge_after if more else None,
+                    return_when=FIRST_COMPLETED,
+                )
+
+                for future in done:
+                    route = running.pop(future)
+                    response, error, chat = future.result()
+
+                    if error:
+                        log.warning(f"Route {':'.join(route)} failed: {error}")
+                        stream.release(route)
+                        continue
+
+                    stream.close(route, response)
+                    return self.finish(route, message, response, chat)
+        finally:
+            # The losing requests can't be cancelled, their responses are dropped
+            executor.shutdown(wait=False)
+
+        return "", error
+
+    def finish(
+        self, route: tuple[str, str], message: str, response: str, chat: AI | AsyncAI
+    ) -> tuple[str, None]:
+        self.conversation.append({"role": "user", "content": message})
+        self.conversation.append({"role": "assistant", "content": response})
+        self.conversation_manager = chat.conversation_manager
+        self.last_usage = chat.last_usage
+        self.last_route = route
+
+        if route != self.routes[0]:
+            log.info(f"Answered by the fallback route {':'.join(route)}")
+            metrics.add(fallbacks=1)
+        metrics.annotate(route=":".join(route))
+
+        return response, None
+
+
+class AsyncRoutedAI(RoutedAI):
+    """
+    Async counterpart of RoutedAI, on AsyncAI chats. The losing requests are
+    cancelled as soon as a route wins.
+    """
+
+    chat_class = AsyncAI
+
+    async def chat(
+        self,
+        message: str,
+        model: str = None,
+        temperature: float = None,
+        retry_delay: int = 5,
+        on_delta: Callable[[str, str], None] = None,
+    ) -> tuple[str, str | None]:
+        """
+        Send a message to the routes, see RoutedAI.chat
+        """
+        candidates = self.candidates(model)
+        hedge_after = self.routing_config["hedge_after"] or None
+        stream = RouteStream(on_delta)
+
+        async def attempt(route):
+            chat = self.get_chat(route).fork(self.conversation)
+            start = time.perf_counter()
+            response, error = await chat.chat(
+                message,
+                temperature=temperature,
+                retry_delay=retry_delay,
+                on_delta=stream.for_route(route),
+            )
+            self.record(route, error, time.perf_counter() - start)
+            return response, error, chat
+
+        running = {}
+        next_route = 0
+        error = None
+
+        try:
+            while True:
+                # Start the next route when nothing runs, or as a hedge
+                if next_route < len(candidates) and (
+                    not running or hedge_after is not None
+                ):
+                    route = candidates[next_route]
+                    if running:
+                        log.info(f"Hedging the request on {':'.join(route)}")
+                        metrics.add(hedges=1)
+                    running[asyncio.create_task(attempt(route))] = route
+                    next_route += 1
+
+                if not running:
+                    break
+
+                more = next_route < len(candidates)
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=hedge_after if more else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                for task in done:
+                    route = running.pop(task)
+                    response, error, chat = task.result()
+
+                    if error:
+                        log.warning(f"Route {':'.join(route)} failed: {error}")
+                        stream.release(route)
+                        continue
+
+                    stream.close(route, response)
+                    return self.finish(route, message, response, chat)
+        finally:
+            for task in running:
+                task.cancel()
+
+        return "", error
+
+
+def create_chat(
+    system_prompt: str, config: GenerationConfig, stage: str
+) -> AI | RoutedAI:
+    """
+    Create the chat of a stage of the generation
+
+    Args:
+        system_prompt (str): The system prompt of the conversation
+        config (GenerationConfig): The params of the generation
+        stage (str): One of STAGES
+
+    Returns:
+        AI | RoutedAI: A chat with the AI provider of the config when the stage has
+            no routes, or routed to the routes of the stage
+    """
+    if not config["routing_params"]["stages"].get(stage):
+        return AI(system_prompt, config)
+
+    return RoutedAI(system_prompt, config, stage_routes(config, stage))
+
+
+def create_async_chat(
+    system_prompt: str, config: GenerationConfig, stage: str
+) -> AsyncAI | AsyncRoutedAI:
+    """
+    Create the async chat of a stage of the generation, see create_chat
+
+    Returns:
+        AsyncAI | AsyncRoutedAI: The chat
+    """
+    if not config["routing_params"]["stages"].get(stage):
+        return AsyncAI(system_prompt, config)
+
+    return AsyncRoutedAI(system_prompt, config, stage_routes(config, stage))
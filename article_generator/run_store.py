@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The outputs of the stages before the article steps, in pipeline order
+STAGES = ["urls", "contents", "summaries", "combined_summary"]
+
+
+def params_fingerprint(article_params: dict) -> str:
+    """
+    Identify the article params of a run, a run is only resumed with the same ones
+    """
+    return hashlib.sha256(
+        json.dumps(article_params, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class RunStore:
+    """
+    Checkpoints of a generation in data/runs/<run_id>: the output of each stage and
+    the conversation of each step, so a failed or interrupted run resumes where it
+    stopped instead of starting over
+    """
+
+    def __init__(self, run_id: str = None, root_dir: Path = None):
+        """
+        Args:
+            run_id (str): The run to resume, or None for a new run
+            root_dir (Path): The directory of the runs, data/runs by default
+        """
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        root_dir = root_dir or ConfigManager().base_dir / "data" / "runs"
+        self.run_dir = root_dir / self.run_id
+        self.steps_dir = self.run_dir / "steps"
+        self.lock = threading.Lock()
+
+    @property
+    def exists(self) -> bool:
+        return (self.run_dir / "run.json").exists()
+
+    def write_json(self, path: Path, value):
+        # Written to a temporary file first so an interruption never leaves a partial
+        # checkpoint
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(value, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def read_json(self, path: Path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            log.warning(f"Ignoring the corrupted checkpoint {path}")
+            return None
+
+    def load_run(self) -> dict | None:
+        """
+        Get the run manifest: its article params, status and error
+
+        Returns:
+            dict | None: The manifest, None if the run doesn't exist
+        """
+        return self.read_json(self.run_dir / "run.json")
+
+    def update_run(self, **fields):
+        """
+        Update the run manifest
+
+        Args:
+            fields: The fields to set, e.g. status="failed"
+        """
+        with self.lock:
+            run = self.load_run() or {
+                "run_id": self.run_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            run.update(fields, updated_at=datetime.now(timezone.utc).isoformat())
+            self.write_json(self.run_dir / "run.json", run)
+
+    def can_resume(self, article_params: dict) -> bool:
+        """
+        Check if the run has checkpoints made with the same article params
+
+        Args:
+            article_params (dict): The article params of the new generation
+
+        Returns:
+            bool: Whether the checkpoints can be reused
+        """
+        run = self.load_run()
+        return bool(run) and run.get("fingerprint") == params_fingerprint(
+            article_params
+        )
+
+    def load_stage(self, stage: str):
+        """
+        Get the output of a stage
+
+        Args:
+            stage (str): One of STAGES
+
+        Returns:
+            The output, None if the stage didn't complete
+        """
+        return self.read_json(self.run_dir / f"{stage}.json")
+
+    def save_stage(self, stage: str, value):
+        """
+        Save the output of a completed stage
+
+        Args:
+            stage (str): One of STAGES
+            value: The output, serializable to JSON
+        """
+        self.write_json(self.run_dir / f"{stage}.json", value)
+
+    def load_steps(self) -> dict[int, dict]:
+        """
+        Get the completed steps
+
+        Returns:
+            dict[int, dict]: The prompt, response and conversation of each step, by index
+        """
+        steps = {}
+        if not self.steps_dir.exists():
+            return steps
+
+        for path in self.steps_dir.glob("*.json"):
+            step = self.read_json(path)
+            if step is not None:
+                steps[step["index"]] = step
+
+        return steps
+
+    def save_step(self, index: int, prompt: str, response: str, conversation: list):
+        """
+        Save a completed step, along with the conversation it was generated in
+
+        Args:
+            index (int): The index of the step
+            prompt (str): The prompt of the step
+            response (str): The response of the step
+            conversation (list): The messages of the step's chat
+        """
+        self.write_json(
+            self.steps_dir / f"{index:03d}.json",
+            {
+                "index": index,
+                "prompt": prompt,
+                "response": response,
+                "conversation": conversation,
+            },
+        )
+
+    def save_article(self, article: str):
+        with open(self.run_dir / "article.md", "w") as f:
+            f.write(article)
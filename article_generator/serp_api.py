@@ -1,24 +1,42 @@
 import serpapi
 from serpapi import SerpApiError, HTTPConnectionError
-from utils.config_manager import ConfigManager
+from utils.cache import DiskCache, get_cache
+from utils.generation_config import GenerationConfig
+from utils.rate_limiter import get_rate_limiter
 from logging_setup import setup_logger
 
 log = setup_logger(__name__)
 
-# Initialize the config manager
-config_manager = ConfigManager()
 
-# Load the param_config.json file
-serp_config = config_manager.load_params()["serp_params"]
-
-
-def get_google_search_top_urls(query: str) -> tuple[list[str], str | None]:
+def get_google_search_top_urls(
+    query: str, use_cache: bool = True, config: GenerationConfig = None
+) -> tuple[list[str], str | None]:
     # Initialize the error
     error = None
 
+    # The SERP params of the generation, read from the params file when not given
+    serp_config = (config or GenerationConfig.load())["serp_params"]
+
+    # Serve the results from the cache if the same search was done recently
+    cache = get_cache("serp") if use_cache else None
+    if cache:
+        cache_key = DiskCache.make_key(
+            query, "google", serp_config["country"], serp_config["max_results"]
+        )
+        urls = cache.get(cache_key)
+
+        if urls is not None:
+            log.info(f"Serving search results for query: {query} from the cache")
+            return urls, None
+
     # Initialize the serpapi client
     serpapi_client = serpapi.Client(api_key=serp_config["api_key"])
 
+    # Wait for room in the searches per minute shared by all the processes
+    rate_limiter = get_rate_limiter()
+    if rate_limiter:
+        rate_limiter.acquire("serpapi")
+
     # Try to get the search results
     try:
         log.info(f"Getting search results for query: {query}")
@@ -59,13 +77,20 @@ def get_google_search_top_urls(query: str) -> tuple[list[str], str | None]:
 
     log.info(f"Returning top {len(urls)} URLs")
 
+    if cache:
+        cache.set(cache_key, urls)
+
     return urls, None
 
 
-def get_youtube_search_top_urls(query: str) -> tuple[list[str], str | None]:
+def get_youtube_search_top_urls(
+    query: str, config: GenerationConfig = None
+) -> tuple[list[str], str | None]:
     # Initialize the error
     error = None
 
+    serp_config = (config or GenerationConfig.load())["serp_params"]
+
     # Initialize the serpapi client
     serpapi_client = serpapi.Client(api_key=serp_config["api_key"])
 
@@ -1,34 +1,430 @@
-from .ai_chat import AI
+import asyncio
+import hashlib
+import json
+import threading
+
+from . import chunker
+from .clients import close_async_clients
+from .router import create_async_chat, stage_routes
+from utils import metrics
+from utils.generation_config import GenerationConfig
+from utils.memo_cache import get_memo_cache
 from logging_setup import setup_logger
 
 log = setup_logger(__name__)
 
+# Caps the in-flight summaries per AI provider and limit across every generation
+# in the process
+provider_semaphores = {}
+provider_semaphores_lock = threading.Lock()
+
+# How often a summary waiting for its provider semaphore checks it again
+SEMAPHORE_POLL_SECONDS = 0.05
+
+SUMMARY_PROMPT = "Create a knowledge base of the tools, templates and references, in 300 words or less for the following website content: {text}"
+
 
-def summarize_website(text: str) -> str:
+class SummaryStats:
     """
-    Function to summarize the text using a specific AI model
+    Counts the summaries served from the cache during a run
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached = 0
+        self.generated = 0
+
+    def record(self, cached: bool):
+        with self.lock:
+            if cached:
+                self.cached += 1
+            else:
+                self.generated += 1
+
+    def __str__(self) -> str:
+        total = self.cached + self.generated
+        return f"{self.cached} of {total} summaries served from the cache"
+
+
+def get_provider_semaphore(ai_provider: str, limit: int) -> threading.BoundedSemaphore:
+    """
+    Get the semaphore capping the in-flight summaries of a provider
+
+    The semaphores are per provider and limit, so a generation configured with
+    another limit gets its own cap instead of the one of the first generation.
 
     Args:
-        text (str): The text to be summarized
-        model (str): The model to use for summarization
+        ai_provider (str): The AI provider of the summaries
+        limit (int): The maximum number of in-flight summaries
 
     Returns:
-        str: The summarized text
+        threading.BoundedSemaphore: The semaphore
     """
+    with provider_semaphores_lock:
+        if (ai_provider, limit) not in provider_semaphores:
+            provider_semaphores[(ai_provider, limit)] = threading.BoundedSemaphore(
+                limit
+            )
+
+        return provider_semaphores[(ai_provider, limit)]
 
-    log.info("Summarizing the website content...")
 
-    prompt = f"Create a knowledge base of the tools, templates and references, in 300 words or less for the following website content: {text[:3000]}"
+async def acquire_provider_slot(semaphore: threading.BoundedSemaphore):
+    """
+    Wait for a provider semaphore without blocking the event loop
+
+    The semaphore is shared with the generations running on other threads and event
+    loops, so it is polled instead of awaited.
+    """
+    while not semaphore.acquire(blocking=False):
+        await asyncio.sleep(SEMAPHORE_POLL_SECONDS)
+
+
+async def gather_limited(coroutines: list, limit: int) -> list:
+    """
+    Run coroutines concurrently, at most limit at a time
+
+    Returns:
+        list: The results, in the order of the coroutines
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+def run_requests(coroutine):
+    """
+    Run the summary requests of a stage on an event loop of their own, closing the
+    async clients of the loop when they are done
+
+    Returns:
+        The result of the coroutine
+    """
+
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await close_async_clients()
+
+    return asyncio.run(run())
+
+
+def get_summary_budget(config: GenerationConfig) -> dict:
+    """
+    Get the chunking budget of the provider and model of the summaries, the model
+    budget overriding the provider one overriding the default
+
+    Args:
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        dict: The chunk_tokens and fan_in
+    """
+    ai_provider, model = stage_routes(config, "summary")[0]
+    budgets = config["summarizer_params"]["budgets"]
+
+    return {
+        **budgets["default"],
+        **budgets.get(ai_provider, {}),
+        **budgets.get(f"{ai_provider}:{model}", {}),
+    }
+
+
+async def summarize_chunk(
+    text: str,
+    use_cache: bool = True,
+    stats: SummaryStats = None,
+    config: GenerationConfig = None,
+) -> tuple[str, str | None]:
+    """
+    Summarize a text fitting in the chunk budget with one AI request
+
+    Args:
+        text (str): The text to be summarized
+        use_cache (bool): Whether to reuse a previous summary of the same text
+        stats (SummaryStats): The run stats to record the cache hit or miss in
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        summary (str): The summarized text
+        error (str | None): The error message if any
+    """
+    config = config or GenerationConfig.load()
+    prompt = SUMMARY_PROMPT.format(text=text)
     try:
-        ai_chat = AI("")
+        ai_chat = create_async_chat("", config, "summary")
     except Exception as e:
         log.error(f"Error initializing AI Chat: {e}")
         return "", f"Error initializing AI Chat"
 
-    summary, summary_error = ai_chat.chat(prompt)
+    # The same text summarized with the same prompt and model gives an equivalent
+    # summary. The SQLite cache is used from a thread, not to block the event loop.
+    cache = await asyncio.to_thread(get_memo_cache, "summaries") if use_cache else None
+    if cache:
+        cache_key = hashlib.sha256(
+            json.dumps(
+                [
+                    text,
+                    SUMMARY_PROMPT,
+                    ai_chat.ai_provider,
+                    ai_chat.default_model,
+                    ai_chat.temperature,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+        summary = await asyncio.to_thread(cache.get, cache_key)
+
+        if summary is not None:
+            log.info("Serving the summary from the cache")
+            metrics.add(cache_hits=1)
+            if stats:
+                stats.record(cached=True)
+            return summary, None
+
+    # The semaphore is only held around the request itself
+    semaphore = get_provider_semaphore(
+        ai_chat.ai_provider, config["summarizer_params"]["provider_max_in_flight"]
+    )
+    await acquire_provider_slot(semaphore)
+    try:
+        summary, summary_error = await ai_chat.chat(prompt)
+    finally:
+        semaphore.release()
 
     if summary_error:
         log.error(f"Error summarizing website content: {summary_error}")
         return "", f"Error summarizing website content:\n\n{summary_error}"
 
+    if cache:
+        await asyncio.to_thread(cache.set, cache_key, summary)
+    if stats:
+        stats.record(cached=False)
+
     return summary, None
+
+
+async def reduce_texts(
+    texts: list[str],
+    use_cache: bool = True,
+    stats: SummaryStats = None,
+    config: GenerationConfig = None,
+) -> tuple[str, str | None]:
+    """
+    Summarize the texts into one summary: each text is summarized concurrently, then
+    the summaries are grouped within the budget and summarized again, level by level,
+    until one is left. No input is ever cut to fit the prompt.
+
+    Args:
+        texts (list[str]): The texts, each fitting in the chunk budget
+        use_cache (bool): Whether to reuse previous summaries of the same texts
+        stats (SummaryStats): The run stats to record the cache hits and misses in
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        summary (str): The summary of all the texts
+        error (str | None): The error message if any
+    """
+    config = config or GenerationConfig.load()
+    budget = get_summary_budget(config)
+    max_workers = config["summarizer_params"]["max_workers"]
+    level = 0
+
+    while True:
+        if len(texts) == 1:
+            return await summarize_chunk(texts[0], use_cache, stats, config)
+
+        log.info(f"Summarizing {len(texts)} chunks, level {level}...")
+
+        results = await gather_limited(
+            [summarize_chunk(text, use_cache, stats, config) for text in texts],
+            max_workers,
+        )
+
+        for summary, summary_error in results:
+            if summary_error:
+                return "", summary_error
+
+        texts = chunker.pack_texts(
+            [summary for summary, _ in results],
+            budget["chunk_tokens"],
+            budget["fan_in"],
+        )
+        level += 1
+
+
+async def summarize_website(
+    text: str,
+    use_cache: bool = True,
+    stats: SummaryStats = None,
+    config: GenerationConfig = None,
+) -> tuple[str, str | None]:
+    """
+    Function to summarize the text using a specific AI model
+
+    A text over the chunk budget of the model is split on its paragraphs, the chunks
+    are summarized concurrently and their summaries reduced into one.
+
+    Args:
+        text (str): The text to be summarized
+        use_cache (bool): Whether to reuse a previous summary of the same text
+        stats (SummaryStats): The run stats to record the cache hit or miss in
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        summary (str): The summarized text
+        error (str | None): The error message if any
+    """
+
+    log.info("Summarizing the website content...")
+
+    config = config or GenerationConfig.load()
+    budget = get_summary_budget(config)
+    chunks = chunker.split_into_chunks(text, budget["chunk_tokens"]) or [text]
+    if len(chunks) > 1:
+        metrics.annotate(chunks=len(chunks))
+
+    return await reduce_texts(chunks, use_cache, stats, config)
+
+
+def combine_summaries(
+    summaries: list[str],
+    use_cache: bool = True,
+    stats: SummaryStats = None,
+    config: GenerationConfig = None,
+) -> tuple[str, str | None]:
+    """
+    Combine the summaries of the pages into one summary, in a single request when
+    they fit in the chunk budget, or reduced in a tree of requests when they don't
+
+    Args:
+        summaries (list[str]): The summaries of the pages
+        use_cache (bool): Whether to reuse previous summaries of the same texts
+        stats (SummaryStats): The run stats to record the cache hits and misses in
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        summary (str): The combined summary
+        error (str | None): The error message if any
+    """
+    config = config or GenerationConfig.load()
+    budget = get_summary_budget(config)
+
+    # Summaries over the budget on their own are split like the pages
+    texts = []
+    for summary in summaries:
+        texts.extend(
+            chunker.split_into_chunks(summary, budget["chunk_tokens"]) or [summary]
+        )
+
+    groups = chunker.pack_texts(texts, budget["chunk_tokens"], budget["fan_in"])
+    if len(groups) > 1:
+        metrics.annotate(groups=len(groups))
+
+    return run_requests(reduce_texts(groups, use_cache, stats, config))
+
+
+async def summarize_pages(
+    contents: list[str],
+    max_workers: int,
+    on_error: str,
+    use_cache: bool,
+    stats: SummaryStats,
+    config: GenerationConfig,
+) -> tuple[list[str], str | None]:
+    """
+    Summarize the contents concurrently on the running event loop, see
+    summarize_websites
+    """
+    pages = asyncio.Semaphore(max_workers)
+
+    async def summarize_page(index: int, content: str) -> tuple:
+        async with pages:
+            with metrics.span("summarize"):
+                return index, await summarize_website(content, use_cache, stats, config)
+
+    tasks = [
+        asyncio.create_task(summarize_page(index, content))
+        for index, content in enumerate(contents)
+    ]
+    results = {}
+    errors = {}
+
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            index, (summary, summary_error) = await next_page
+
+            if summary_error:
+                errors[index] = summary_error
+
+                if on_error == "abort":
+                    log.error(f"Error summarizing content {index + 1}: {summary_error}")
+                    return [], summary_error
+
+                log.warning(f"Skipping content {index + 1}: {summary_error}")
+                continue
+
+            results[index] = summary
+    finally:
+        # The requests of the pages still running after an abort are cancelled
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if not results:
+        # Every page failed, surface the first error
+        return [], errors[min(errors)]
+
+    log.info(f"Summarized {len(results)} contents, skipped {len(errors)}.")
+
+    return [results[index] for index in sorted(results)], None
+
+
+def summarize_websites(
+    contents: list[str],
+    max_workers: int = None,
+    on_error: str = None,
+    use_cache: bool = True,
+    stats: SummaryStats = None,
+    config: GenerationConfig = None,
+) -> tuple[list[str], str | None]:
+    """
+    Summarize the contents concurrently
+
+    The requests of every page and chunk are sent from one event loop with AsyncAI,
+    instead of a thread each.
+
+    Args:
+        contents (list[str]): The texts to be summarized
+        max_workers (int): The maximum number of pages summarized at the same time
+        on_error (str): "skip" to drop the pages that fail, "abort" to stop at the first failure
+        use_cache (bool): Whether to reuse previous summaries of the same texts
+        stats (SummaryStats): The run stats to record the cache hits and misses in
+        config (GenerationConfig): The params of the generation
+
+    Returns:
+        summaries (list[str]): The summaries, in the same order as the contents
+        error (str | None): The error message if any
+    """
+
+    log.info(f"Summarizing {len(contents)} contents...")
+
+    # Load the summarizer params, the arguments take precedence
+    config = config or GenerationConfig.load()
+    summarizer_config = config["summarizer_params"]
+    max_workers = max_workers or summarizer_config["max_workers"]
+    on_error = on_error or summarizer_config["on_error"]
+
+    if on_error not in ("skip", "abort"):
+        raise ValueError(f"Invalid summarizer on_error policy: {on_error}")
+
+    if not contents:
+        return [], "There is no content to summarize"
+
+    return run_requests(
+        summarize_pages(contents, max_workers, on_error, use_cache, stats, config)
+    )
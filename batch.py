@@ -0,0 +1,295 @@
+"""
+Generate articles in batch, without the Streamlit UI.
+
+The input is a CSV or JSONL file where each row is a set of article params
+(keyphrase, article_type, language, expertise_field, product_name,
+product_description, product_url). Only the keyphrase is required, the rest
+default to the article params saved in the params file. An optional "id"
+column names the output file, the items are named after their keyphrase
+otherwise. The ids are slugified and must be unique.
+
+Each article is written as Markdown to the output directory, along with a
+manifest.json holding the status of every item. Running the same batch again
+resumes it, skipping the items that are already done and resuming the failed
+ones from their last completed step.
+
+Usage:
+    python batch.py articles.csv --output-dir data/batches/articles --concurrency 4
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+from article_generator.article_generator import ArticleGenerator
+from article_generator.progress import LoggingProgressReporter
+from article_generator.prompt_templates import get_prompt_templates
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+ARTICLE_FIELDS = [
+    "keyphrase",
+    "article_type",
+    "language",
+    "expertise_field",
+    "product_name",
+    "product_description",
+    "product_url",
+]
+
+
+def slugify(text: str) -> str:
+    """
+    Turn a text into a name safe to use as a file name
+
+    Args:
+        text (str): The text, e.g. a keyphrase
+
+    Returns:
+        str: The lowercase letters and digits of the text separated by dashes, empty
+            if it has none
+    """
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:60].strip("-")
+
+
+def load_items(input_path: Path) -> list[dict]:
+    """
+    Load the article params from a CSV or JSONL file
+
+    Args:
+        input_path (Path): The path to the input file
+
+    Returns:
+        list[dict]: The items, each with an id and the article params
+    """
+    if input_path.suffix == ".csv":
+        with open(input_path, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+    elif input_path.suffix in (".jsonl", ".ndjson"):
+        with open(input_path, "r") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError("The input file must be a .csv or .jsonl file")
+
+    # Compiling the templates checks them before any article is generated
+    prompts = get_prompt_templates()
+    items = []
+    rows_by_id = {}
+
+    for index, row in enumerate(rows):
+        article_params = {
+            field: row[field] for field in ARTICLE_FIELDS if row.get(field)
+        }
+
+        if "keyphrase" not in article_params:
+            raise ValueError(f"Row {index + 1} is missing the keyphrase")
+
+        article_type = article_params.get("article_type")
+        if article_type and article_type not in prompts:
+            raise ValueError(
+                f"Row {index + 1} has an invalid article type: {article_type}"
+            )
+
+        # Name the item after its keyphrase unless it has an explicit id, so the
+        # ids don't change when the rows are reordered and the batch is resumed
+        if row.get("id"):
+            item_id = slugify(str(row["id"]))
+            if not item_id:
+                raise ValueError(f"Row {index + 1} has an invalid id: {row['id']}")
+        else:
+            keyphrase = article_params["keyphrase"]
+            item_id = (
+                slugify(keyphrase)
+                or hashlib.sha256(keyphrase.encode("utf-8")).hexdigest()[:12]
+            )
+
+        if item_id in rows_by_id:
+            raise ValueError(
+                f"Rows {rows_by_id[item_id]} and {index + 1} have the same id "
+                f"{item_id}, give them distinct ids in an id column"
+            )
+        rows_by_id[item_id] = index + 1
+
+        items.append({"id": item_id, "article_params": article_params})
+
+    return items
+
+
+class Manifest:
+    """
+    Status of every item of a batch, persisted to manifest.json after each change
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if path.exists():
+            with open(path, "r") as f:
+                self.items = json.load(f)["items"]
+        else:
+            self.items = {}
+
+    def update(self, item_id: str, **fields):
+        with self.lock:
+            self.items.setdefault(item_id, {}).update(
+                fields, updated_at=datetime.now(timezone.utc).isoformat()
+            )
+
+            # Write to a temporary file first so an interruption never corrupts it
+            tmp_path = self.path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"items": self.items}, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def get(self, item_id: str) -> dict:
+        with self.lock:
+            return dict(self.items.get(item_id, {}))
+
+    def is_done(self, item_id: str) -> bool:
+        with self.lock:
+            return self.items.get(item_id, {}).get("status") == "done"
+
+
+def generate_item(item: dict, output_dir: Path, manifest: Manifest, use_cache: bool):
+    item_id = item["id"]
+    output_path = output_dir / f"{item_id}.md"
+
+    log.info(f"[{item_id}] Generating article...")
+    manifest.update(item_id, status="running", error=None)
+
+    # A failed item resumes its run from the last completed step
+    run_id = manifest.get(item_id).get("run_id")
+    article_generator = None
+
+    try:
+        article_generator = ArticleGenerator(item["article_params"])
+        article, error = article_generator.generate(
+            LoggingProgressReporter(item_id), use_cache=use_cache, run_id=run_id
+        )
+    except Exception as e:
+        log.exception(f"[{item_id}] Unexpected error generating the article")
+        article, error = "", f"Unexpected error: {e}"
+
+    if article_generator and article_generator.run_id:
+        manifest.update(item_id, run_id=article_generator.run_id)
+
+    if error:
+        log.error(f"[{item_id}] {error}")
+        manifest.update(item_id, status="failed", error=error)
+        return
+
+    with open(output_path, "w") as f:
+        f.write(article)
+
+    log.info(f"[{item_id}] Article written to {output_path}")
+    manifest.update(item_id, status="done", output=output_path.name)
+
+
+def run_batch(
+    input_path: Path, output_dir: Path, concurrency: int, use_cache: bool = True
+) -> Manifest:
+    """
+    Generate the articles of a batch, skipping the ones already done
+
+    Args:
+        input_path (Path): The CSV or JSONL file with the article params
+        output_dir (Path): The directory to write the articles and manifest to
+        concurrency (int): The number of articles to generate at the same time
+        use_cache (bool): Whether to reuse the cached search results, pages and summaries
+
+    Returns:
+        Manifest: The manifest of the batch
+    """
+    items = load_items(input_path)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(output_dir / "manifest.json")
+
+    pending = []
+    for item in items:
+        if manifest.is_done(item["id"]) and (output_dir / f"{item['id']}.md").exists():
+            continue
+
+        manifest.update(
+            item["id"], status="pending", article_params=item["article_params"]
+        )
+        pending.append(item)
+
+    log.info(
+        f"Batch has {len(items)} items, {len(items) - len(pending)} already done, "
+        f"generating {len(pending)} with a concurrency of {concurrency}"
+    )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(generate_item, item, output_dir, manifest, use_cache): item
+            for item in pending
+        }
+
+        # Writing the article or the manifest can fail too, the item is then failed
+        # instead of staying running
+        for future in as_completed(futures):
+            item_id = futures[future]["id"]
+            try:
+                future.result()
+            except Exception as e:
+                log.exception(f"[{item_id}] Unexpected error processing the item")
+                try:
+                    manifest.update(item_id, status="failed", error=f"{e}")
+                except Exception:
+                    log.exception(f"[{item_id}] Could not update the manifest")
+
+    failed = [
+        item_id
+        for item_id, item in manifest.items.items()
+        if item["status"] == "failed"
+    ]
+    log.info(f"Batch finished, {len(failed)} items failed")
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate articles in batch")
+    parser.add_argument(
+        "input", type=Path, help="CSV or JSONL file with the article params"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        help="Directory for the articles and manifest (default: data/batches/<input name>)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=2, help="Articles generated at the same time"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse cached search results, pages and summaries",
+    )
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or (
+        ConfigManager().base_dir / "data" / "batches" / args.input.stem
+    )
+
+    manifest = run_batch(
+        args.input, output_dir, args.concurrency, use_cache=not args.no_cache
+    )
+
+    failed = [item for item in manifest.items.values() if item["status"] == "failed"]
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
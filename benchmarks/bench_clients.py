@@ -0,0 +1,57 @@
+"""
+Benchmark the provider client reuse: count the new connections opened and measure
+the latency per summary against a local stub of the OpenAI API.
+
+Usage:
+    python -m benchmarks.bench_clients
+"""
+
+import os
+import statistics
+import time
+
+from openai import OpenAI
+
+from article_generator.clients import get_client
+from benchmarks.stub_server import StubServer, StubOpenAIHandler
+
+SUMMARIES = 30
+API_KEY = "sk-stub"
+
+
+def summarize(client: OpenAI):
+    client.chat.completions.create(
+        messages=[{"role": "user", "content": "Summarize this page"}],
+        model="stub",
+    )
+
+
+def run(label: str, server: StubServer, get_summary_client):
+    server.requests = 0
+    server.connections.clear()
+    latencies = []
+
+    for _ in range(SUMMARIES):
+        start = time.perf_counter()
+        summarize(get_summary_client())
+        latencies.append(time.perf_counter() - start)
+
+    print(
+        f"{label:<30} {len(server.connections):>12} "
+        f"{statistics.median(latencies) * 1000:>10.1f}ms "
+        f"{max(latencies) * 1000:>10.1f}ms"
+    )
+
+
+def main():
+    with StubServer(StubOpenAIHandler) as server:
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+
+        print(f"{SUMMARIES} summaries")
+        print(f"{'':<30} {'connections':>12} {'median':>12} {'max':>12}")
+        run("new client per summary", server, lambda: OpenAI(api_key=API_KEY))
+        run("shared client (registry)", server, lambda: get_client("openai", API_KEY))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark the config access of a full generation: count the params and prompts loads
+of a run against local stubs of the pages and of the OpenAI API, and compare the
+cost of the cached loads with reading the files on every call.
+
+Usage:
+    python -m benchmarks.bench_config
+"""
+
+import json
+import logging
+import os
+import time
+import timeit
+from collections import Counter
+
+from article_generator import serp_api
+from article_generator.article_generator import ArticleGenerator
+from benchmarks.stub_server import StubServer, StubOpenAIHandler
+from utils.config_manager import ConfigManager
+
+RUNS = 1000
+
+
+def count_loads(counter: Counter):
+    """
+    Count the calls of the config loading methods
+    """
+    for name in ("load_params", "load_prompts"):
+        method = getattr(ConfigManager, name)
+
+        def counted(self, method=method, name=name):
+            counter[name] += 1
+            return method(self)
+
+        setattr(ConfigManager, name, counted)
+
+
+def per_call(function) -> float:
+    return timeit.timeit(function, number=RUNS) / RUNS
+
+
+def main():
+    # The loads are logged, keep the output to the results
+    logging.disable(logging.INFO)
+
+    config_manager = ConfigManager()
+    prompts_path = config_manager.base_dir / "article_generator" / "prompts.json"
+
+    def read_prompts():
+        with open(prompts_path) as f:
+            return f.read()
+
+    costs = {
+        "load_params": (
+            per_call(config_manager.read_params),
+            per_call(config_manager.load_params),
+        ),
+        "load_prompts": (
+            per_call(lambda: json.loads(read_prompts())),
+            per_call(config_manager.load_prompts),
+        ),
+    }
+
+    calls = Counter()
+    count_loads(calls)
+
+    with StubServer(StubOpenAIHandler) as server:
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        urls = [f"{server.url}/fast?page={i}" for i in range(10)]
+        serp_api.get_google_search_top_urls = lambda query, **kwargs: (urls, None)
+
+        start = time.perf_counter()
+        _, error = ArticleGenerator().generate(use_cache=False)
+        elapsed = time.perf_counter() - start
+
+    if error:
+        print(f"Generation failed: {error}")
+        return
+
+    print(f"Generation against the stubs: {elapsed:.2f}s\n")
+    print(
+        f"{'':<14} {'calls':>6} {'uncached':>12} {'cached':>12} "
+        f"{'run uncached':>14} {'run cached':>12}"
+    )
+    for name, (uncached, cached) in costs.items():
+        print(
+            f"{name:<14} {calls[name]:>6} {uncached * 1e6:>10.1f}us "
+            f"{cached * 1e6:>10.1f}us {calls[name] * uncached * 1000:>12.2f}ms "
+            f"{calls[name] * cached * 1000:>10.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
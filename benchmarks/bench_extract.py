@@ -0,0 +1,169 @@
+"""
+Benchmark the HTML extractors on a corpus of saved pages: throughput and the peak
+memory used on top of the loaded pages, each extractor in a fresh interpreter.
+
+The corpus is every .html file of a directory. Without one, a synthetic corpus of
+pages shaped like search results (menus, inline scripts, sidebars, comments, an
+article) is generated under data/benchmarks/corpus.
+
+Usage:
+    python -m benchmarks.bench_extract [--corpus DIR] [--max-chars 3000]
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from utils.config_manager import ConfigManager
+
+RUNS = 3
+
+# Synthetic pages: name, paragraphs of article, size of the inline scripts in KB
+SYNTHETIC_PAGES = [
+    ("blog", 30, 40),
+    ("news", 60, 400),
+    ("docs", 150, 100),
+    ("forum", 20, 50),
+    ("store", 10, 1500),
+]
+
+WORDS = (
+    "search engine optimization content keyword ranking page article link audience "
+    "traffic landing product guide write strategy marketing google results meta"
+).split()
+
+
+def sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def synthetic_page(rng: random.Random, paragraphs: int, script_kb: int) -> str:
+    menu = "".join(
+        f"<li><a href='/{i}'>{rng.choice(WORDS)}</a></li>" for i in range(80)
+    )
+    script = "var data = " + json.dumps(
+        [{"id": i, "name": sentence(rng, 4)} for i in range(script_kb * 25)]
+    )
+    article = "".join(
+        f"<h2>{sentence(rng, 5)}</h2><p>{sentence(rng)} {sentence(rng)} "
+        f"<a href='#'>{rng.choice(WORDS)}</a> {sentence(rng)}</p>"
+        for _ in range(paragraphs)
+    )
+    sidebar = "".join(
+        f"<div class='widget'><h3>{sentence(rng, 3)}</h3><p>{sentence(rng)}</p></div>"
+        for _ in range(30)
+    )
+    comments = "".join(
+        f"<div class='comment'><p>{sentence(rng)}</p></div>" for _ in range(100)
+    )
+
+    return (
+        f"<!DOCTYPE html><html><head><title>{sentence(rng, 6)}</title>"
+        f"<style>{'.a{color:red}' * 2000}</style><script>{script}</script></head>"
+        f"<body><header><nav><ul>{menu}</ul></nav></header>"
+        f"<div class='cookie-banner'>{sentence(rng)}</div>"
+        f"<main><article><h1>{sentence(rng, 8)}</h1>{article}</article>"
+        f"<div id='comments'>{comments}</div></main>"
+        f"<aside class='sidebar'>{sidebar}</aside>"
+        f"<footer><ul>{menu}</ul></footer></body></html>"
+    )
+
+
+def synthetic_corpus() -> Path:
+    corpus_dir = ConfigManager().base_dir / "data" / "benchmarks" / "corpus"
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(0)
+
+    for name, paragraphs, script_kb in SYNTHETIC_PAGES:
+        path = corpus_dir / f"{name}.html"
+        if not path.exists():
+            path.write_text(synthetic_page(rng, paragraphs, script_kb))
+
+    return corpus_dir
+
+
+def peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_extractor(extractor: str, corpus_dir: Path, max_chars: int) -> dict:
+    """
+    Extract the corpus with one extractor, in the current interpreter
+
+    Returns:
+        dict: The MB of HTML per second, the pages per second, the peak memory on
+            top of the pages and the chars extracted
+    """
+    from article_generator.html_extractor import extract_text
+
+    pages = [path.read_text() for path in sorted(corpus_dir.glob("*.html"))]
+    html_mb = sum(len(page) for page in pages) / 1e6
+
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        texts = [extract_text(page, max_chars, extractor) for page in pages]
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mb_per_second": html_mb * RUNS / elapsed,
+        "pages_per_second": len(pages) * RUNS / elapsed,
+        "peak_rss_mb": (peak_rss_kb() - rss_before) / 1024,
+        "chars": sum(len(text) for text in texts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", type=Path, help="Directory of saved .html pages")
+    parser.add_argument("--max-chars", type=int, default=3000)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus or synthetic_corpus()
+
+    if args.worker:
+        print(json.dumps(run_extractor(args.worker, corpus_dir, args.max_chars)))
+        return
+
+    pages = list(corpus_dir.glob("*.html"))
+    size_mb = sum(path.stat().st_size for path in pages) / 1e6
+    print(f"{len(pages)} pages, {size_mb:.1f} MB in {corpus_dir}\n")
+    print(
+        f"{'extractor':<12} {'max_chars':>9} {'MB/s':>8} {'pages/s':>8} "
+        f"{'peak RSS':>10} {'chars':>8}"
+    )
+
+    for extractor in ("bs4", "html.parser", "lxml"):
+        for max_chars in (0, args.max_chars):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench_extract",
+                    "--worker",
+                    extractor,
+                    "--corpus",
+                    str(corpus_dir),
+                    "--max-chars",
+                    str(max_chars),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{extractor:<12} {max_chars or 'all':>9} "
+                f"{result['mb_per_second']:>8.1f} {result['pages_per_second']:>8.1f} "
+                f"{result['peak_rss_mb']:>8.1f}MB {result['chars']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
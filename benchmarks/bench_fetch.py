@@ -0,0 +1,124 @@
+"""
+Benchmark the content fetching against a local stub server with slow and failing
+endpoints.
+
+Usage:
+    python -m benchmarks.bench_fetch
+"""
+
+import time
+import tracemalloc
+
+import requests
+
+from article_generator import content_fetcher
+from article_generator.html_extractor import extract_text
+from benchmarks.stub_server import StubServer
+
+
+def timed(label: str, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:6.2f}s")
+    return result
+
+
+def measured(label: str, function, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<40} {elapsed:6.2f}s {peak / 1e6:8.1f}MB peak  {len(result):>6} chars"
+    )
+    return result
+
+
+def download_whole(url: str) -> str:
+    """
+    Download the whole page before looking at it, as fetch_content used to
+    """
+    try:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        return extract_text(response.text, max_chars=3000)
+    except Exception:
+        return ""
+
+
+def compare_downloads(server: StubServer):
+    print("\nLarge and non-HTML pages")
+    for path in ("/huge?mb=50", "/pdf?kb=20000", "/latin1"):
+        url = f"{server.url}{path}"
+        measured(f"{path} whole download", download_whole, url)
+        measured(
+            f"{path} streamed",
+            content_fetcher.fetch_content,
+            url,
+            use_cache=False,
+            max_chars=3000,
+        )
+
+
+def main():
+    with StubServer() as server:
+        urls = [
+            f"{server.url}/fast?page=1",
+            f"{server.url}/slow?delay=3",
+            f"{server.url}/fail",
+            f"{server.url}/fast?page=2",
+            f"{server.url}/slow?delay=2",
+            f"{server.url}/fast?page=3",
+            f"{server.url}/fail?page=2",
+            f"{server.url}/slow?delay=8",
+            f"{server.url}/fast?page=4",
+            f"{server.url}/fast?page=5",
+        ]
+
+        sequential = timed(
+            "sequential",
+            lambda: [
+                c
+                for url in urls
+                if (c := content_fetcher.fetch_content(url, use_cache=False))
+            ],
+        )
+        concurrent, _ = timed(
+            "concurrent (per host limit 10)",
+            content_fetcher.fetch_all_contents,
+            urls,
+            per_host_limit=10,
+            use_cache=False,
+        )
+        deadline, _ = timed(
+            "concurrent + 4s deadline",
+            content_fetcher.fetch_all_contents,
+            urls,
+            per_host_limit=10,
+            use_cache=False,
+            deadline=4,
+        )
+        first_n, _ = timed(
+            "concurrent + first 5 good pages",
+            content_fetcher.fetch_all_contents,
+            urls,
+            per_host_limit=10,
+            use_cache=False,
+            first_n=5,
+        )
+
+        print()
+        print(f"sequential pages:  {len(sequential)}")
+        print(f"concurrent pages:  {len(concurrent)}")
+        print(f"deadline pages:    {len(deadline)}")
+        print(f"first_n pages:     {len(first_n)}")
+        print(f"same order:        {sequential == concurrent}")
+
+        compare_downloads(server)
+
+
+if __name__ == "__main__":
+    main()
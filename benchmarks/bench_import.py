@@ -0,0 +1,61 @@
+"""
+Benchmark the startup cost of importing the article generator, as paid by every
+batch, CLI or API worker, and how much of it would be the Streamlit UI stack.
+
+Usage:
+    python -m benchmarks.bench_import
+"""
+
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+
+IMPORT_CHECK = (
+    "import sys, time;"
+    "start = time.perf_counter();"
+    "import {module};"
+    "print(time.perf_counter() - start, 'streamlit' in sys.modules)"
+)
+
+
+def time_import(module: str) -> tuple[float, bool]:
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        tuple: The median import time in seconds and whether streamlit was imported
+    """
+    timings = []
+
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_CHECK.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        timings.append(float(output[-2]))
+        imports_streamlit = output[-1] == "True"
+
+    return statistics.median(timings), imports_streamlit
+
+
+def main():
+    headless, headless_streamlit = time_import("article_generator.article_generator")
+    with_ui, _ = time_import("article_generator.article_generator, streamlit")
+
+    print(f"{'import':<45} {'median':>8} {'streamlit':>10}")
+    print(
+        f"{'article_generator (headless, after)':<45} {headless:7.3f}s "
+        f"{str(headless_streamlit):>10}"
+    )
+    print(
+        f"{'article_generator + streamlit (before)':<45} {with_ui:7.3f}s {'True':>10}"
+    )
+    print(f"\nSaved per worker startup: {with_ui - headless:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark the provider routing against a local stub of the OpenAI API, with a
+primary model that is slow or overloaded: the latency per request and the errors,
+with the primary only, with a fallback model, and with hedged requests.
+
+Usage:
+    python -m benchmarks.bench_router
+"""
+
+import os
+import statistics
+import time
+
+from article_generator import router
+from benchmarks.stub_server import StubServer, StubOpenAIHandler
+from utils.generation_config import GenerationConfig
+
+REQUESTS = 20
+
+PRIMARY = "primary-model"
+FALLBACK = "fallback-model"
+ROUTES = [f"openai:{PRIMARY}", f"openai:{FALLBACK}"]
+
+
+def run(label: str, server: StubServer, routes: list[str], hedge_after: float = 0):
+    # Every scenario starts with a healthy circuit breaker
+    router.route_health = router.RouteHealth()
+    server.requests = 0
+
+    config = GenerationConfig.load(
+        {
+            "ai_provider": "openai",
+            "openai_params": {"api_key": "sk-stub", "default_model": PRIMARY},
+            "routing_params": {
+                "stages": {"step": routes},
+                "hedge_after": hedge_after,
+                "max_retries": 1,
+            },
+        }
+    )
+
+    latencies = []
+    errors = 0
+    for _ in range(REQUESTS):
+        chat = router.create_chat("", config, "step")
+        start = time.perf_counter()
+        _, error = chat.chat("Write the introduction", retry_delay=0)
+        latencies.append(time.perf_counter() - start)
+        errors += bool(error)
+
+    latencies.sort()
+    print(
+        f"{label:<34} {statistics.median(latencies) * 1000:>8.0f}ms "
+        f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>8.0f}ms "
+        f"{errors:>7} {server.requests:>9}"
+    )
+
+
+def main():
+    with StubServer(StubOpenAIHandler) as server:
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        header = f"{'':<34} {'median':>10} {'p95':>10} {'errors':>7} {'requests':>9}"
+
+        print(f"{REQUESTS} requests, primary answering in 2s")
+        print(header)
+        StubOpenAIHandler.model_delays = {PRIMARY: 2.0}
+        run("primary only", server, [])
+        run("hedged after 0.3s on fallback", server, ROUTES, 0.3)
+
+        print(f"\n{REQUESTS} requests, primary overloaded (529)")
+        print(header)
+        StubOpenAIHandler.model_delays = {}
+        StubOpenAIHandler.model_statuses = {PRIMARY: 529}
+        run("primary only", server, [])
+        run("fallback on error", server, ROUTES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the pooled HTTP session of the content fetching against a local stub
+server: new connections, latency, bytes transferred and transient errors recovered,
+compared with a bare requests.get per page.
+
+Usage:
+    python -m benchmarks.bench_session
+"""
+
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from utils.http_session import get_session
+
+PAGES = 100
+WORKERS = 8
+
+
+def bare_get(url: str) -> int:
+    return requests.get(url, timeout=10).status_code
+
+
+def pooled_get(url: str) -> int:
+    return get_session().get(url, timeout=10).status_code
+
+
+def run(label: str, server: StubServer, get, urls: list[str]):
+    server.requests = 0
+    server.bytes_sent = 0
+    server.connections.clear()
+    latencies = []
+
+    def timed_get(url: str) -> int:
+        start = time.perf_counter()
+        status = get(url)
+        latencies.append(time.perf_counter() - start)
+        return status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        statuses = list(executor.map(timed_get, urls))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{label:<28} {elapsed:>7.2f}s {len(server.connections):>12} "
+        f"{statistics.median(latencies) * 1000:>8.1f}ms "
+        f"{server.bytes_sent / 1e3:>8.0f}KB "
+        f"{statuses.count(200):>4}/{len(urls)} ok"
+    )
+
+
+def main():
+    with StubServer() as server:
+        pages = [f"{server.url}/fast?page={i}" for i in range(PAGES)]
+
+        print(f"{PAGES} pages, {WORKERS} workers")
+        print(
+            f"{'':<28} {'total':>8} {'connections':>12} {'median':>10} "
+            f"{'sent':>10} {'status':>8}"
+        )
+        run("bare requests.get", server, bare_get, pages)
+        run("pooled session", server, pooled_get, pages)
+
+        # Each flaky page fails twice with a 503 before serving the page
+        print("\nFlaky pages (two 503 errors first)")
+        run(
+            "bare requests.get",
+            server,
+            bare_get,
+            [f"{server.url}/flaky?id=bare-{i}&fails=2" for i in range(20)],
+        )
+        run(
+            "pooled session (2 retries)",
+            server,
+            pooled_get,
+            [f"{server.url}/flaky?id=pooled-{i}&fails=2" for i in range(20)],
+        )
+
+
+if __name__ == "__main__":
+    main()
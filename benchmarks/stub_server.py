@@ -0,0 +1,199 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PAGE = """<html><head><title>Stub page</title></head>
+<body><h1>Stub page {path}</h1>{paragraphs}</body></html>"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves fake pages for the benchmarks:
+
+    - /fast: a small HTML page
+    - /slow?delay=5: the same page after a delay
+    - /fail: a 500 error
+    - /pdf?kb=2000: a PDF file
+    - /huge?mb=20: a page streamed without a Content-Length
+    - /latin1: a page in ISO-8859-1, declared in a <meta> tag only
+    - /flaky?id=a&fails=2: a 503 error for the first requests of each id, then the page
+    - /fast and the other pages are gzip compressed when the client accepts it
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # The headers and body are written apart, don't delay the body on kept-alive
+    # connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.count_request(self)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/fail":
+            self.send_body(500, b"Internal Server Error", "text/plain")
+            return
+
+        if url.path == "/pdf":
+            # Written in pieces, the server shares the process with the benchmarks
+            kb = int(query.get("kb", ["2000"])[0])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(kb * 1024))
+            self.end_headers()
+            for _ in range(kb):
+                self.wfile.write(b"0" * 1024)
+            return
+
+        if url.path == "/huge":
+            self.send_huge_page(float(query.get("mb", ["20"])[0]))
+            return
+
+        if url.path == "/latin1":
+            body = (
+                '<html><head><meta charset="iso-8859-1"></head>'
+                "<body><p>Caf\u00e9 cr\u00e8me br\u00fbl\u00e9e</p></body></html>"
+            ).encode("iso-8859-1")
+            self.send_body(200, body, "text/html")
+            return
+
+        if url.path == "/flaky":
+            key = query.get("id", [""])[0]
+            with self.server.lock:
+                self.server.failures[key] = self.server.failures.get(key, 0) + 1
+                failed = self.server.failures[key]
+            if failed <= int(query.get("fails", ["2"])[0]):
+                self.send_body(503, b"Service Unavailable", "text/plain")
+                return
+
+        if url.path == "/slow":
+            time.sleep(float(query.get("delay", ["5"])[0]))
+
+        paragraphs = "".join(f"<p>Paragraph {i} of {self.path}</p>" for i in range(50))
+        body = PAGE.format(path=self.path, paragraphs=paragraphs).encode()
+        self.send_body(200, body, "text/html; charset=utf-8")
+
+    def send_body(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        if content_type.startswith("text/html") and accepts_gzip:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_huge_page(self, mb: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk = "".join(f"<div><p>Paragraph {i}</p></div>" for i in range(1000))
+        chunks = [b"<html><body>"] + [chunk.encode()] * int(mb * 1e6 / len(chunk))
+        for data in chunks + [b"</body></html>"]:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOpenAIHandler(StubHandler):
+    """
+    Answers the OpenAI chat completions endpoint with a fixed completion after a
+    short delay, to stand in for the provider
+    """
+
+    delay = 0.05
+
+    # Per model: the delay before answering, and the error status answered instead
+    model_delays = {}
+    model_statuses = {}
+
+    def do_POST(self):
+        self.server.count_request(self)
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.model_delays.get(request.get("model"), self.delay))
+
+        status = self.model_statuses.get(request.get("model"))
+        if status:
+            error = {"error": {"message": "Overloaded", "type": "overloaded_error"}}
+            self.send_body(status, json.dumps(error).encode(), "application/json")
+            return
+
+        if request.get("stream"):
+            self.send_stream(["Stub ", "summary."])
+            return
+
+        completion = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "Stub summary."},
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+        }
+        self.send_body(200, json.dumps(completion).encode(), "application/json")
+
+    def send_stream(self, deltas: list[str]):
+        events = [
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [{"index": 0, "delta": {"content": delta}}],
+            }
+            for delta in deltas
+        ]
+        body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+        body += "data: [DONE]\n\n"
+        self.send_body(200, body.encode(), "text/event-stream")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler=StubHandler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = set()
+        self.failures = {}
+        self.bytes_sent = 0
+
+    def count_request(self, handler: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            self.connections.add(handler.client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients dropping slow requests after their deadline is expected
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,210 @@
+import http.client
+import json
+import socket
+import threading
+import time
+import unittest
+
+from api import APIServer
+from article_generator.jobs import JobManager
+
+
+class StubGenerator:
+    """
+    Generates a fixed article without any search or AI provider, reporting its
+    progress like ArticleGenerator
+    """
+
+    # The configs of the generations, to check the overrides of the jobs
+    configs = []
+
+    # Holds the generations of the "wait" keyphrase until set
+    release = threading.Event()
+
+    def __init__(self, article_params: dict, config):
+        self.article_params = article_params
+        self.run_id = "abc123"
+        StubGenerator.configs.append(config)
+
+    def generate(self, progress, use_cache: bool = True, run_id: str = None):
+        keyphrase = self.article_params["keyphrase"]
+
+        progress.status(f"Writing about {keyphrase}")
+        progress.progress(0.5, text="Halfway")
+        progress.step_text(0, "Hello")
+        progress.step_text(0, "Hello world")
+
+        if keyphrase == "wait":
+            StubGenerator.release.wait(10)
+        if keyphrase == "fail":
+            return "", "Stub failure"
+
+        return f"# {keyphrase}\n\nHello world", None
+
+
+class APITestCase(unittest.TestCase):
+    api_key = None
+
+    def setUp(self):
+        StubGenerator.configs.clear()
+        StubGenerator.release.clear()
+
+        job_manager = JobManager(2, 60, generator_factory=StubGenerator)
+        self.server = APIServer(("127.0.0.1", 0), job_manager, api_key=self.api_key)
+        self.port = self.server.server_address[1]
+
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+
+    def tearDown(self):
+        StubGenerator.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.job_manager.executor.shutdown(wait=True)
+
+    def request(self, method: str, path: str, body=None, headers: dict = None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        connection.request(method, path, body=data, headers=headers or {})
+
+        response = connection.getresponse()
+        content = response.read().decode("utf-8")
+        connection.close()
+
+        if response.getheader("Content-Type") == "application/json":
+            content = json.loads(content)
+        return response.status, content
+
+    def raw_request(self, request: bytes) -> str:
+        with socket.create_connection(("127.0.0.1", self.port), timeout=10) as sock:
+            sock.sendall(request)
+            return sock.recv(65536).decode("utf-8")
+
+    def submit(self, keyphrase: str = "seo tools", **fields) -> str:
+        status, body = self.request(
+            "POST", "/jobs", {"article_params": {"keyphrase": keyphrase}, **fields}
+        )
+        self.assertEqual(status, 202, body)
+        return body["id"]
+
+    def wait_for_job(self, job_id: str) -> dict:
+        for _ in range(100):
+            status, body = self.request("GET", f"/jobs/{job_id}")
+            self.assertEqual(status, 200)
+            if body["status"] in ("complete", "failed"):
+                return body
+            time.sleep(0.05)
+
+        self.fail(f"Job {job_id} did not finish")
+
+
+class TestJobs(APITestCase):
+    def test_submit_poll_and_result(self):
+        job_id = self.submit()
+
+        job = self.wait_for_job(job_id)
+        self.assertEqual(job["status"], "complete")
+        self.assertEqual(job["progress"], 0.5)
+        self.assertEqual(job["status_texts"], ["Writing about seo tools"])
+        self.assertEqual(job["run_id"], "abc123")
+
+        status, article = self.request("GET", f"/jobs/{job_id}/result")
+        self.assertEqual(status, 200)
+        self.assertEqual(article, "# seo tools\n\nHello world")
+
+    def test_result_of_running_and_failed_jobs(self):
+        job_id = self.submit("wait")
+        status, _ = self.request("GET", f"/jobs/{job_id}/result")
+        self.assertEqual(status, 409)
+        StubGenerator.release.set()
+        self.assertEqual(self.wait_for_job(job_id)["status"], "complete")
+
+        job_id = self.submit("fail")
+        self.assertEqual(self.wait_for_job(job_id)["error"], "Stub failure")
+        status, body = self.request("GET", f"/jobs/{job_id}/result")
+        self.assertEqual((status, body), (422, {"error": "Stub failure"}))
+
+    def test_unknown_job(self):
+        status, _ = self.request("GET", "/jobs/0123456789ab")
+        self.assertEqual(status, 404)
+
+    def test_overrides_reach_the_generation(self):
+        job_id = self.submit(ai_provider="openai", model="stub-model")
+        self.wait_for_job(job_id)
+
+        config = StubGenerator.configs[0]
+        self.assertEqual(config["ai_provider"], "openai")
+        self.assertEqual(config["openai_params"]["default_model"], "stub-model")
+
+    def test_events(self):
+        job_id = self.submit()
+        status, stream = self.request("GET", f"/jobs/{job_id}/events")
+        self.assertEqual(status, 200)
+
+        events = []
+        for message in stream.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in message.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+
+        steps = [data for event, data in events if event == "step"]
+        self.assertEqual("".join(step["delta"] for step in steps), "Hello world")
+        self.assertIn(("status", {"text": "Writing about seo tools"}), events)
+        self.assertEqual(
+            events[-1],
+            ("done", {"status": "complete", "error": None, "run_id": "abc123"}),
+        )
+
+
+class TestValidation(APITestCase):
+    def test_invalid_bodies(self):
+        cases = [
+            {"article_params": {"keyphrase": ["not", "a", "string"]}},
+            {"article_params": {"keyphrase": "seo", "language": 3}},
+            {"article_params": {"keyphrase": "seo", "unknown": "x"}},
+            {"article_params": {"keyphrase": ""}},
+            {"article_params": {"keyphrase": "seo"}, "ai_provider": ["openai"]},
+            {"article_params": {"keyphrase": "seo"}, "run_id": 123},
+            {"article_params": {"keyphrase": "seo"}, "use_cache": "no"},
+            ["not", "an", "object"],
+        ]
+        for body in cases:
+            with self.subTest(body=body):
+                status, response = self.request("POST", "/jobs", body)
+                self.assertEqual(status, 400)
+                self.assertIn("error", response)
+
+    def test_content_length(self):
+        response = self.raw_request(b"POST /jobs HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertTrue(response.startswith("HTTP/1.1 411"), response)
+
+        for length in (b"abc", b"-1"):
+            response = self.raw_request(
+                b"POST /jobs HTTP/1.1\r\nHost: x\r\nContent-Length: "
+                + length
+                + b"\r\n\r\n{}"
+            )
+            self.assertTrue(response.startswith("HTTP/1.1 400"), response)
+
+        response = self.raw_request(
+            b"POST /jobs HTTP/1.1\r\nHost: x\r\nContent-Length: 99999999\r\n\r\n"
+        )
+        self.assertTrue(response.startswith("HTTP/1.1 413"), response)
+
+
+class TestAuth(APITestCase):
+    api_key = "secret"
+
+    def test_api_key_required(self):
+        for headers in ({}, {"Authorization": "Bearer wrong"}):
+            with self.subTest(headers=headers):
+                status, _ = self.request("GET", "/health", headers=headers)
+                self.assertEqual(status, 401)
+
+        status, _ = self.request(
+            "GET", "/health", headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(status, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
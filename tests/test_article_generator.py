@@ -0,0 +1,39 @@
+import unittest
+
+from article_generator.article_generator import ArticleGenerator
+from article_generator.prompt_templates import get_prompt_templates
+from utils.generation_config import GenerationConfig
+
+
+class TestStepDependencies(unittest.TestCase):
+    def create_generator(self, article_type: str) -> ArticleGenerator:
+        config = GenerationConfig.load(
+            {"article_params": {"article_type": article_type}}
+        )
+        return ArticleGenerator(config=config)
+
+    def test_steps_without_depends_on_see_every_previous_step(self):
+        for article_type, templates in get_prompt_templates().items():
+            with self.subTest(article_type=article_type):
+                generator = self.create_generator(article_type)
+
+                for index, step in enumerate(templates["steps"]):
+                    if step["depends_on"] is None:
+                        self.assertEqual(generator.ancestors[index], set(range(index)))
+
+    def test_listicle_ancestors(self):
+        generator = self.create_generator("listicle")
+        last = len(generator.steps) - 1
+
+        # The tool overviews only depend on the outline and the introduction
+        for index in range(3, last - 1):
+            self.assertEqual(generator.dependencies[index], {0, 1})
+            self.assertEqual(generator.ancestors[index], {0, 1})
+
+        # The comparison and the conclusion are written after every tool
+        self.assertEqual(generator.ancestors[last - 1], set(range(last - 1)))
+        self.assertEqual(generator.ancestors[last], set(range(last)))
+
+
+if __name__ == "__main__":
+    unittest.main()
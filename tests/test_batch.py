@@ -0,0 +1,61 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import batch
+
+
+class StubGenerator:
+    """
+    Generates a fixed article without any search or AI provider
+    """
+
+    def __init__(self, article_params: dict):
+        self.article_params = article_params
+        self.run_id = None
+
+    def generate(self, progress, use_cache: bool = True, run_id: str = None):
+        return f"# {self.article_params['keyphrase']}", None
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output_dir = Path(self.directory.name) / "output"
+
+        self.input_path = Path(self.directory.name) / "articles.jsonl"
+        with open(self.input_path, "w") as f:
+            for keyphrase in ("first article", "second article"):
+                f.write(json.dumps({"keyphrase": keyphrase}) + "\n")
+
+        patcher = mock.patch.object(batch, "ArticleGenerator", StubGenerator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_items_are_written(self):
+        manifest = batch.run_batch(self.input_path, self.output_dir, 2)
+
+        self.assertEqual(manifest.get("first-article")["status"], "done")
+        self.assertEqual(
+            (self.output_dir / "second-article.md").read_text(), "# second article"
+        )
+
+    def test_item_failing_to_save_is_failed(self):
+        # The article can't be written over a directory
+        (self.output_dir / "first-article.md").mkdir(parents=True)
+
+        manifest = batch.run_batch(self.input_path, self.output_dir, 2)
+
+        self.assertEqual(manifest.get("first-article")["status"], "failed")
+        self.assertEqual(manifest.get("second-article")["status"], "done")
+
+        with open(self.output_dir / "manifest.json") as f:
+            saved = json.load(f)["items"]
+        self.assertEqual(saved["first-article"]["status"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from article_generator.conversation import (
+    ConversationManager,
+    count_messages_tokens,
+)
+
+
+def make_conversation(turns: int, words: int = 50) -> list[dict]:
+    conversation = [{"role": "system", "content": "You write articles."}]
+    for index in range(turns):
+        conversation.append({"role": "user", "content": f"question {index} " * words})
+        conversation.append(
+            {"role": "assistant", "content": f"answer {index} " * words}
+        )
+    conversation.append({"role": "user", "content": "Next step"})
+    return conversation
+
+
+class TestWindow(unittest.TestCase):
+    def test_fitting_conversation_is_sent_whole(self):
+        conversation = make_conversation(5)
+        manager = ConversationManager(100000, 2, 1)
+
+        self.assertEqual(manager.window(conversation), conversation)
+        self.assertEqual(manager.last_input_tokens, manager.last_full_input_tokens)
+
+    def test_over_budget_keeps_the_pinned_and_last_turns(self):
+        conversation = make_conversation(5)
+        manager = ConversationManager(100, 2, 1)
+
+        messages = manager.window(conversation)
+
+        # The system message, the first turn, the last two turns and the new message
+        self.assertEqual(
+            messages, conversation[:3] + conversation[-5:-1] + conversation[-1:]
+        )
+        self.assertLess(manager.last_input_tokens, manager.last_full_input_tokens)
+
+    def test_keep_no_last_turns(self):
+        conversation = make_conversation(5)
+        manager = ConversationManager(100, 0, 1)
+
+        messages = manager.window(conversation)
+
+        self.assertEqual(messages, conversation[:3] + conversation[-1:])
+
+    def test_system_prompt_counts_in_the_budget(self):
+        # The Claude conversations send the system prompt apart from the messages
+        conversation = make_conversation(5)[1:]
+        manager = ConversationManager(count_messages_tokens(conversation), 2, 1)
+
+        self.assertEqual(manager.window(conversation), conversation)
+        self.assertEqual(len(manager.window(conversation, "system " * 50)), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
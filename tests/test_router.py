@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from article_generator import router
+from utils.generation_config import GenerationConfig
+
+PRIMARY = ("openai", "primary-model")
+HEDGE = ("openai", "hedge-model")
+
+
+class StubChat:
+    """
+    Streams a fixed response, a delta every delay seconds
+    """
+
+    def __init__(self, route: tuple, deltas: list[str], delay: float):
+        self.ai_provider, self.default_model = route
+        self.temperature = 0.7
+        self.conversation_manager = None
+        self.last_usage = {}
+        self.deltas = deltas
+        self.delay = delay
+        self.finished = threading.Event()
+
+    def fork(self, turns: list[dict]) -> "StubChat":
+        return self
+
+    def chat(self, message, temperature=None, retry_delay=5, on_delta=None):
+        text = ""
+        for delta in self.deltas:
+            time.sleep(self.delay)
+            text += delta
+            if on_delta:
+                on_delta(delta, text)
+
+        self.finished.set()
+        return text, None
+
+
+class StubRoutedAI(router.RoutedAI):
+    def __init__(self, config: GenerationConfig, chats: dict):
+        self.stub_chats = chats
+        super().__init__("", config, list(chats))
+
+    def get_chat(self, route: tuple) -> StubChat:
+        return self.stub_chats[route]
+
+
+class AsyncStubChat(StubChat):
+    async def chat(self, message, temperature=None, retry_delay=5, on_delta=None):
+        text = ""
+        for delta in self.deltas:
+            await asyncio.sleep(self.delay)
+            text += delta
+            if on_delta:
+                on_delta(delta, text)
+
+        self.finished.set()
+        return text, None
+
+
+class StubAsyncRoutedAI(StubRoutedAI, router.AsyncRoutedAI):
+    pass
+
+
+class TestHedgedStreaming(unittest.TestCase):
+    def setUp(self):
+        router.route_health = router.RouteHealth()
+        self.config = GenerationConfig.load(
+            {
+                "routing_params": {
+                    "stages": {"step": [":".join(PRIMARY), ":".join(HEDGE)]},
+                    "hedge_after": 0.1,
+                    "latency_threshold": 60,
+                }
+            }
+        )
+
+    def test_losing_route_stops_streaming_once_the_hedge_wins(self):
+        # The primary streams first, then keeps streaming after the hedge has won
+        primary = StubChat(PRIMARY, ["slow "] * 10, 0.05)
+        hedge = StubChat(HEDGE, ["fast answer"], 0.05)
+        chat = StubRoutedAI(self.config, {PRIMARY: primary, HEDGE: hedge})
+
+        streamed = []
+        response, error = chat.chat("Write", on_delta=lambda d, t: streamed.append(t))
+
+        self.assertIsNone(error)
+        self.assertEqual(response, "fast answer")
+        self.assertEqual(chat.last_route, HEDGE)
+
+        # The deltas of the primary sent after the hedge won are dropped
+        self.assertTrue(primary.finished.wait(5))
+        self.assertEqual(streamed[-1], "fast answer")
+
+    def test_winning_stream_is_not_sent_twice(self):
+        # The hedge starts while the primary streams, the primary wins
+        primary = StubChat(PRIMARY, ["hello ", "world"], 0.1)
+        hedge = StubChat(HEDGE, ["late"], 1)
+        chat = StubRoutedAI(self.config, {PRIMARY: primary, HEDGE: hedge})
+
+        streamed = []
+        response, _ = chat.chat("Write", on_delta=lambda d, t: streamed.append(d))
+
+        self.assertEqual(response, "hello world")
+        self.assertEqual(streamed, ["hello ", "world"])
+
+    def test_async_losing_route_is_cancelled(self):
+        primary = AsyncStubChat(PRIMARY, ["slow "] * 10, 0.05)
+        hedge = AsyncStubChat(HEDGE, ["fast answer"], 0.05)
+        chat = StubAsyncRoutedAI(self.config, {PRIMARY: primary, HEDGE: hedge})
+
+        async def run():
+            streamed = []
+            response, error = await chat.chat(
+                "Write", on_delta=lambda d, t: streamed.append(t)
+            )
+            # Give a primary that wasn't cancelled the time to finish
+            await asyncio.sleep(0.6)
+            return response, error, streamed
+
+        response, error, streamed = asyncio.run(run())
+
+        self.assertIsNone(error)
+        self.assertEqual(response, "fast answer")
+        self.assertEqual(streamed[-1], "fast answer")
+        self.assertFalse(primary.finished.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# Sets between two scans of the namespace, to account for the entries written by
+# the other processes sharing it
+EVICT_EVERY = 500
+
+
+class DiskCache:
+    """
+    Persistent key-value cache stored under data/cache/<namespace>.
+
+    Every entry is a JSON file addressed by the hash of its key. Entries expire after
+    their TTL, but are kept on disk so callers can revalidate them (e.g. with an ETag).
+    The namespace is kept under max_bytes by evicting the least recently used entries,
+    once the estimated size of the namespace goes over it.
+    """
+
+    def __init__(self, namespace: str, ttl: float, max_bytes: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.cache_dir = ConfigManager().base_dir / "data" / "cache" / namespace
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        # The size of the namespace, counted on the first set and kept up to date
+        # by the sets, so they don't scan the whole namespace
+        self.total_bytes = None
+        self.sets = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Hash the key parts into the name of the entry file
+
+        Returns:
+            str: The hex digest of the key parts
+        """
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get_entry(self, key: str) -> dict | None:
+        """
+        Get the entry for a key, even if it has expired
+
+        Args:
+            key (str): The key of the entry
+
+        Returns:
+            dict | None: The entry, with the value, meta and expires_at fields
+        """
+        path = self._path(key)
+
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # Mark the entry as recently used for the LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return entry
+
+    def get(self, key: str):
+        """
+        Get the value for a key if it hasn't expired
+
+        Args:
+            key (str): The key of the entry
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        entry = self.get_entry(key)
+
+        if entry is None or entry["expires_at"] < time.time():
+            self.record_miss()
+            return None
+
+        self.record_hit()
+        return entry["value"]
+
+    def set(self, key: str, value, meta: dict = None, ttl: float = None):
+        """
+        Store a value, replacing any previous entry
+
+        Args:
+            key (str): The key of the entry
+            value: The JSON serializable value to store
+            meta (dict): Extra data about the value, e.g. validators for revalidation
+            ttl (float): The seconds until the entry expires, defaults to the cache TTL
+        """
+        entry = {
+            "value": value,
+            "meta": meta or {},
+            "expires_at": time.time() + (ttl if ttl is not None else self.ttl),
+        }
+
+        # Write to a temporary file first so readers never see a partial entry
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+        try:
+            replaced_bytes = path.stat().st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            written_bytes = tmp_path.stat().st_size
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning(f"Could not write {self.namespace} cache entry: {e}")
+            return
+
+        with self.lock:
+            self.sets += 1
+            if self.total_bytes is not None:
+                self.total_bytes += written_bytes - replaced_bytes
+
+            scan = (
+                self.total_bytes is None
+                or self.total_bytes > self.max_bytes
+                or self.sets % EVICT_EVERY == 0
+            )
+
+        if scan:
+            self.evict()
+
+    def record_hit(self, revalidated: bool = False):
+        with self.lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes, and
+        reset the estimated size of the namespace to its scanned size
+        """
+        entries = []
+        total_bytes = 0
+
+        for item in os.scandir(self.cache_dir):
+            if not item.name.endswith(".json"):
+                continue
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+            total_bytes += stat.st_size
+
+        if total_bytes > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+                if total_bytes <= self.max_bytes:
+                    break
+
+            log.debug(f"Evicted {self.namespace} cache down to {total_bytes} bytes")
+
+        with self.lock:
+            self.total_bytes = total_bytes
+
+    def stats(self) -> dict:
+        """
+        Get the hit and miss counters
+
+        Returns:
+            dict: The hits, misses and revalidated hits since the cache was created
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+            }
+
+
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str) -> DiskCache | None:
+    """
+    Get the process-wide cache for a namespace
+
+    Args:
+        namespace (str): The cache namespace, "serp" or "pages"
+
+    Returns:
+        DiskCache | None: The cache, or None if caching is disabled
+    """
+    cache_config = ConfigManager().load_params()["cache_params"]
+
+    if not cache_config["enabled"]:
+        return None
+
+    with caches_lock:
+        if namespace not in caches:
+            caches[namespace] = DiskCache(
+                namespace,
+                ttl=cache_config[f"{namespace}_ttl"],
+                max_bytes=cache_config["max_mb"] * 1024 * 1024,
+            )
+
+        return caches[namespace]
@@ -1,19 +1,114 @@
 import json
+import os
+import pickle
+import threading
 from pathlib import Path
 from logging_setup import setup_logger
 
 log = setup_logger(__name__)
 
+# The root of the repository
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def merge_defaults(params: dict, defaults: dict) -> dict:
+    """
+    Recursively fill the keys missing in params with the values in defaults
+
+    Args:
+        params (dict): The params loaded from disk
+        defaults (dict): The default params
+
+    Returns:
+        dict: The params with the missing keys filled in
+    """
+    for key, value in defaults.items():
+        if key not in params:
+            params[key] = value
+        elif isinstance(value, dict) and isinstance(params[key], dict):
+            merge_defaults(params[key], value)
+
+    return params
+
+
+def apply_overrides(params: dict, overrides: dict) -> dict:
+    """
+    Recursively replace the values of params with the ones in overrides
+
+    Args:
+        params (dict): The params
+        overrides (dict): The values to replace, nested like the params
+
+    Returns:
+        dict: The params with the overrides applied
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(params.get(key), dict):
+            apply_overrides(params[key], value)
+        else:
+            params[key] = value
+
+    return params
+
+
+def file_signature(*paths: Path) -> tuple:
+    """
+    Get a value that changes whenever one of the files is modified or replaced
+
+    Returns:
+        tuple: The inode, modification time and size of each file
+    """
+    signature = ()
+    for path in paths:
+        stat = os.stat(path)
+        signature += (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    return signature
+
+
+# The parsed config files of the process, pickled so every caller gets its own copy
+# to modify, with the signature of the files they were parsed from
+config_cache = {}
+config_cache_lock = threading.Lock()
+
+
+def load_cached(name: str, paths: list[Path], load) -> dict:
+    """
+    Get a config from the process cache, loading it again if its files changed
+
+    Args:
+        name (str): The name of the config, e.g. "params"
+        paths (list[Path]): The files the config is loaded from
+        load (Callable[[], dict]): Loads the config from the files
+
+    Returns:
+        dict: A copy of the config
+    """
+    signature = file_signature(*paths)
+
+    with config_cache_lock:
+        cached = config_cache.get(name)
+
+    if cached and cached[0] == signature:
+        return pickle.loads(cached[1])
+
+    config = load()
+
+    with config_cache_lock:
+        config_cache[name] = (signature, pickle.dumps(config, pickle.HIGHEST_PROTOCOL))
+
+    return config
+
 
 class ConfigManager:
+    # Functions called with the params after every save, e.g. to drop stale clients
+    save_listeners = []
+
     def __init__(self):
         log.info("Initializing Config Manager...")
 
         # Define the base directory
-        self.base_dir = Path(__file__).resolve().parent.parent
-
-        # Ensure the data, params directories exist
-        (self.base_dir / "data" / "params").mkdir(parents=True, exist_ok=True)
+        self.base_dir = BASE_DIR
         self.params_dir = self.base_dir / "data" / "params"
 
         # Define the params path
@@ -23,13 +118,31 @@ class ConfigManager:
         if not self.params_path.exists():
             log.info("No params file found, creating default params file...")
 
+            # Ensure the data, params directories exist
+            self.params_dir.mkdir(parents=True, exist_ok=True)
+
             with open(self.base_dir / "default_params.json", "r") as f:
                 default_params = json.load(f)
                 self.save_params(default_params)
 
     def load_params(self):
         """
-        Load the params from the data directory
+        Load the params from the data directory, parsed again only when the params
+        file or the default params change
+
+        Returns:
+            dict: The params
+        """
+
+        return load_cached(
+            "params",
+            [self.params_path, self.base_dir / "default_params.json"],
+            self.read_params,
+        )
+
+    def read_params(self) -> dict:
+        """
+        Read the params from disk, bypassing the cache
 
         Returns:
             dict: The params
@@ -39,7 +152,13 @@ class ConfigManager:
 
         # Load the data
         with open(self.params_path, "r") as f:
-            return json.load(f)
+            params = json.load(f)
+
+        # Fill in any sections added after the params file was created
+        with open(self.base_dir / "default_params.json", "r") as f:
+            default_params = json.load(f)
+
+        return merge_defaults(params, default_params)
 
     def save_params(self, params):
         """
@@ -54,26 +173,47 @@ class ConfigManager:
 
         log.info("Saving params...")
 
-        # Save the params
-        with open(self.params_path, "w") as f:
+        # The listeners compare the saved params with the ones they replace
+        previous_params = self.load_params() if self.params_path.exists() else None
+
+        # Written to a temporary file first so other workers never read a partial file
+        tmp_path = (
+            self.params_dir / f"params.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with open(tmp_path, "w") as f:
             json.dump(params, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.params_path)
+
+        for listener in ConfigManager.save_listeners:
+            listener(params, previous_params)
+
+    @classmethod
+    def add_save_listener(cls, listener):
+        """
+        Register a function to call with the saved and the replaced params after
+        every save
+
+        Args:
+            listener (Callable[[dict, dict | None], None]): The function to call, the
+                replaced params are None on the first save
+        """
+        cls.save_listeners.append(listener)
 
     def load_prompts(self) -> dict:
         """
-        Load the prompt config file
+        Load the prompt config file, parsed again only when it changes
 
         Returns:
             dict: The loaded prompts file
         """
 
-        log.info("Loading prompts...")
+        # Define the prompts path
+        prompts_path = self.base_dir / "article_generator" / "prompts.json"
 
-        # Define the base directory
-        base_dir = Path(__file__).resolve().parent.parent
+        def read_prompts() -> dict:
+            log.info("Loading prompts...")
 
-        # Define the prompts path
-        prompts_path = base_dir / "article_generator" / "prompts.json"
+            with open(prompts_path, "r") as f:
+                return json.load(f)
 
-        # Load the config
-        with open(prompts_path, "r") as f:
-            return json.load(f)
+        return load_cached("prompts", [prompts_path], read_prompts)
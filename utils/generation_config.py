@@ -0,0 +1,92 @@
+import copy
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from utils.config_manager import ConfigManager, apply_overrides
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+
+def freeze(value):
+    """
+    Make a read-only copy of a params value, dicts become mappings and lists tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    Make a mutable copy of a frozen params value, e.g. to serialize it
+    """
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+@dataclass(frozen=True, eq=False)
+class GenerationConfig:
+    """
+    The params of a single generation, read once when it starts and passed through
+    the pipeline (SERP, fetch, summarizer, AI), so generations with different params
+    run side by side and never see a params file saved while they run.
+
+    The sections read like the params dict, e.g. config["serp_params"]["api_key"],
+    but can't be modified.
+    """
+
+    params: Mapping
+
+    @classmethod
+    def load(cls, overrides: dict = None) -> "GenerationConfig":
+        """
+        Read the config from the params file
+
+        Args:
+            overrides (dict): Values replacing the saved params for this generation
+                only, nested like the params, e.g. {"ai_provider": "claude"}
+
+        Returns:
+            GenerationConfig: The config
+        """
+        params = ConfigManager().load_params()
+        return cls(freeze(apply_overrides(params, copy.deepcopy(overrides or {}))))
+
+    def replace(self, overrides: dict) -> "GenerationConfig":
+        """
+        Get a copy of the config with some values replaced
+
+        Args:
+            overrides (dict): The values to replace, nested like the params
+
+        Returns:
+            GenerationConfig: The new config
+        """
+        return GenerationConfig(freeze(apply_overrides(self.to_dict(), overrides)))
+
+    def __getitem__(self, section: str) -> Any:
+        return self.params[section]
+
+    def __contains__(self, section: str) -> bool:
+        return section in self.params
+
+    def to_dict(self) -> dict:
+        return thaw(self.params)
+
+    @property
+    def ai_provider(self) -> str:
+        return self.params["ai_provider"]
+
+    @property
+    def provider_params(self) -> Mapping:
+        """
+        The params of the AI provider of the generation, e.g. its model
+        """
+        return self.params[f"{self.ai_provider}_params"]
@@ -0,0 +1,103 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The statuses worth retrying a GET on, the server may answer the next attempt
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# The adapter holding the connection pools shared by the sessions of every thread of
+# the process, and the headers of the sessions
+shared = None
+shared_lock = threading.Lock()
+
+# requests sessions aren't thread-safe (cookies, redirects), so each thread has its
+# own session mounted on the shared adapter
+local = threading.local()
+
+
+def create_adapter(http_config: dict) -> HTTPAdapter:
+    """
+    Create the pooled adapter, retrying the idempotent requests on connection errors
+    and transient statuses with an exponential backoff
+
+    Args:
+        http_config (dict): The http_params
+
+    Returns:
+        HTTPAdapter: The adapter
+    """
+    retry = Retry(
+        total=http_config["retries"],
+        backoff_factor=http_config["backoff_factor"],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET", "HEAD"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+    return HTTPAdapter(
+        pool_connections=http_config["pool_connections"],
+        pool_maxsize=http_config["pool_maxsize"],
+        max_retries=retry,
+    )
+
+
+def get_session() -> requests.Session:
+    """
+    Get the session of the current thread, sharing the keep-alive connections of the
+    process
+
+    Returns:
+        requests.Session: The session
+    """
+    global shared
+
+    with shared_lock:
+        if shared is None:
+            http_config = ConfigManager().load_params()["http_params"]
+            headers = {
+                "User-Agent": http_config["user_agent"],
+                **http_config["headers"],
+            }
+            shared = (create_adapter(http_config), headers)
+
+        adapter, headers = shared
+
+    session = getattr(local, "session", None)
+    if session is None or session.get_adapter("https://") is not adapter:
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        # Accept-Encoding keeps the requests default, every compression urllib3 can
+        # decode (gzip and deflate, br and zstd when their packages are installed)
+        session.headers.update(headers)
+        local.session = session
+
+    return session
+
+
+def invalidate_session(params: dict, previous_params: dict | None):
+    """
+    Create a new adapter for the next requests, with the params that were just saved
+
+    The old connections aren't closed, fetches still using them finish normally.
+
+    Args:
+        params (dict): The params that were just saved
+        previous_params (dict | None): The params they replaced
+    """
+    global shared
+
+    with shared_lock:
+        shared = None
+
+
+ConfigManager.add_save_listener(invalidate_session)
@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+
+class MemoCache:
+    """
+    Persistent memoization table stored in a SQLite database under data/cache.
+
+    Entries don't expire, the table is kept under max_entries by evicting the least
+    recently used entries. SQLite handles the locking between threads and processes.
+    """
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max_entries
+
+        cache_dir = ConfigManager().base_dir / "data" / "cache"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = cache_dir / f"{name}.sqlite3"
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_used_at ON entries (last_used_at)"
+            )
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> str | None:
+        """
+        Get the value for a key
+
+        Args:
+            key (str): The key of the entry
+
+        Returns:
+            str | None: The cached value, or None on a miss
+        """
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT value FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+
+                if row:
+                    connection.execute(
+                        "UPDATE entries SET last_used_at = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+        except sqlite3.Error as e:
+            log.warning(f"Could not read {self.name} cache entry: {e}")
+            row = None
+
+        with self.lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        """
+        Store a value, replacing any previous entry, and evict the oldest entries
+
+        Args:
+            key (str): The key of the entry
+            value (str): The value to store
+        """
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, last_used_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                connection.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    "SELECT key FROM entries ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            log.warning(f"Could not write {self.name} cache entry: {e}")
+
+    def stats(self) -> dict:
+        """
+        Get the hit and miss counters
+
+        Returns:
+            dict: The hits and misses since the cache was created
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+memo_caches = {}
+memo_caches_lock = threading.Lock()
+
+
+def get_memo_cache(name: str) -> MemoCache | None:
+    """
+    Get the process-wide memoization cache for a name
+
+    Args:
+        name (str): The cache name, e.g. "summaries"
+
+    Returns:
+        MemoCache | None: The cache, or None if caching is disabled
+    """
+    cache_config = ConfigManager().load_params()["cache_params"]
+
+    if not cache_config["enabled"]:
+        return None
+
+    with memo_caches_lock:
+        if name not in memo_caches:
+            memo_caches[name] = MemoCache(
+                name, max_entries=cache_config[f"{name}_max_entries"]
+            )
+
+        return memo_caches[name]
@@ -0,0 +1,220 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The run and the innermost span of the current thread or task
+current_run = contextvars.ContextVar("current_run", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+span_ids = itertools.count(1)
+lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed stage of a run, with counters (tokens, retries...) added while it runs
+    """
+
+    def __init__(self, name: str, attributes: dict, parent: "Span | None"):
+        self.id = next(span_ids)
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.counters = defaultdict(int)
+        self.started_at = time.time()
+        self.wall_time = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "parent_id": self.parent.id if self.parent else None,
+            "name": self.name,
+            "attributes": self.attributes,
+            "started_at": self.started_at,
+            "wall_time": self.wall_time,
+            "counters": dict(self.counters),
+        }
+
+
+class RunMetrics:
+    """
+    The spans of a single generation, exported as a JSON run report
+    """
+
+    def __init__(self, run_id: str = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.spans = []
+
+    @contextmanager
+    def activate(self):
+        """
+        Record the spans of the current context, and of the threads it submits work to
+        """
+        token = current_run.set(self)
+        try:
+            yield self
+        finally:
+            current_run.reset(token)
+
+    def report(self) -> dict:
+        """
+        Get the run report
+
+        Returns:
+            dict: The spans of the run and the totals per stage
+        """
+        with lock:
+            spans = [span.to_dict() for span in self.spans]
+
+        stages = defaultdict(lambda: defaultdict(float))
+        for span in spans:
+            stage = stages[span["name"]]
+            stage["count"] += 1
+            stage["wall_time"] += span["wall_time"]
+            for counter, value in span["counters"].items():
+                stage[counter] += value
+
+        return {
+            "run_id": self.run_id,
+            "started_at": datetime.fromtimestamp(
+                self.started_at, timezone.utc
+            ).isoformat(),
+            "stages": {name: dict(stage) for name, stage in stages.items()},
+            "spans": spans,
+        }
+
+    def save(self):
+        """
+        Write the run report to data/metrics/<run_id>.json and the process counters to
+        data/metrics/metrics.prom
+        """
+        metrics_dir = ConfigManager().base_dir / "data" / "metrics"
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(metrics_dir / f"{self.run_id}.json", "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+        # Written to a temporary file first so scrapers never read a partial file
+        tmp_path = metrics_dir / f"metrics.prom.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(registry.to_prometheus())
+        os.replace(tmp_path, metrics_dir / "metrics.prom")
+
+        log.info(f"Run report saved to {metrics_dir / f'{self.run_id}.json'}")
+
+
+class Registry:
+    """
+    Process-wide counters per stage, exported in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.values = defaultdict(float)
+
+    def observe(self, span: Span):
+        with lock:
+            self.values[("postify_stage_calls_total", span.name)] += 1
+            self.values[("postify_stage_seconds_total", span.name)] += span.wall_time
+            for counter, value in span.counters.items():
+                self.values[(f"postify_stage_{counter}_total", span.name)] += value
+
+    def to_prometheus(self) -> str:
+        """
+        Get the counters in the Prometheus text format
+
+        Returns:
+            str: The exposition text
+        """
+        with lock:
+            values = sorted(self.values.items())
+
+        lines = []
+        for (metric, stage), value in values:
+            if not lines or not lines[-1].startswith(metric + "{"):
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{stage="{stage}"}} {value:g}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage of the current run
+
+    Args:
+        name (str): The name of the stage, e.g. "fetch" or "step"
+        attributes: Extra data about the stage, e.g. the URL or step number
+
+    Yields:
+        Span: The span
+    """
+    record = Span(name, attributes, current_span.get())
+    token = current_span.set(record)
+    start = time.perf_counter()
+
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - start
+        current_span.reset(token)
+
+        run = current_run.get()
+        if run:
+            with lock:
+                run.spans.append(record)
+        registry.observe(record)
+
+
+def add(**counters):
+    """
+    Add to the counters of the current span and of the spans it is nested in
+
+    Args:
+        counters: The values to add, e.g. input_tokens=120 or retries=1
+    """
+    with lock:
+        record = current_span.get()
+        while record:
+            for counter, value in counters.items():
+                record.counters[counter] += value
+            record = record.parent
+
+
+def annotate(**attributes):
+    """
+    Add to the attributes of the current span
+
+    Args:
+        attributes: The data to add, e.g. skipped="content type application/pdf"
+    """
+    with lock:
+        record = current_span.get()
+        if record:
+            record.attributes.update(attributes)
+
+
+def submit(executor, function, *args, **kwargs):
+    """
+    Submit work to an executor, keeping the current run and span in the worker thread
+
+    Returns:
+        Future: The future of the work
+    """
+    return executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
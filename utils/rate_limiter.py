@@ -0,0 +1,453 @@
+import asyncio
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from utils.config_manager import ConfigManager
+from logging_setup import setup_logger
+
+log = setup_logger(__name__)
+
+# The rate limit headers of OpenAI (x-ratelimit-remaining-tokens) and Anthropic
+# (anthropic-ratelimit-tokens-remaining)
+RATE_LIMIT_HEADERS = [
+    re.compile(
+        r"^x-ratelimit-(?P<field>limit|remaining|reset)-(?P<kind>requests|tokens)$"
+    ),
+    re.compile(
+        r"^anthropic-ratelimit-(?P<kind>requests|tokens)-(?P<field>limit|remaining|reset)$"
+    ),
+]
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: str) -> float | None:
+    """
+    Get the seconds until a rate limit resets
+
+    Args:
+        value (str): A duration like "6m0s" or "20ms" (OpenAI) or a RFC 3339 date (Anthropic)
+
+    Returns:
+        float | None: The seconds until the reset, or None if the value can't be parsed
+    """
+    if "T" in value:
+        try:
+            reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return max(0.0, reset_at.timestamp() - time.time())
+
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_rate_limit_headers(headers) -> dict:
+    """
+    Get the rate limits reported in the headers of a response
+
+    Args:
+        headers: The response headers
+
+    Returns:
+        dict: The limit, remaining and reset seconds per kind ("requests", "tokens")
+    """
+    limits = {}
+
+    for name, value in headers.items():
+        for pattern in RATE_LIMIT_HEADERS:
+            match = pattern.match(name.lower())
+            if not match:
+                continue
+
+            field = match["field"]
+            if field == "reset":
+                parsed = parse_reset(value)
+            else:
+                try:
+                    parsed = float(value)
+                except ValueError:
+                    parsed = None
+
+            if parsed is not None:
+                limits.setdefault(match["kind"], {})[field] = parsed
+
+    return limits
+
+
+def retry_after_seconds(headers) -> float | None:
+    """
+    Get the delay asked by the Retry-After headers of a rate limited response
+
+    Returns:
+        float | None: The seconds to wait, or None if the headers don't say
+    """
+    if headers is None:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(retry_delay: float, attempt: int, retry_after: float = None) -> float:
+    """
+    Get the delay before retrying a failed request
+
+    The Retry-After delay of the server is used when known. Otherwise the delay grows
+    exponentially with the attempt, and half of it is random so that the clients
+    throttled together don't retry together.
+
+    Args:
+        retry_delay (float): The base delay
+        attempt (int): The number of the failed attempt
+        retry_after (float): The delay asked by the server, if any
+
+    Returns:
+        float: The seconds to wait
+    """
+    if retry_after is not None:
+        return retry_after * random.uniform(1, 1.2)
+
+    delay = retry_delay * (2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RateLimiter:
+    """
+    Token buckets for the requests, tokens and searches per minute of each provider
+    and model, stored in a SQLite database under data so every thread and process of
+    the machine shares them.
+
+    A bucket holds up to a minute of quota and refills continuously. The limits in
+    rate_limit_params are the starting point; the limits, remaining quota and reset
+    times reported in the response headers replace them as soon as they are known.
+    """
+
+    def __init__(self, limits: dict):
+        """
+        Args:
+            limits (dict): The configured per minute limits of each scope, e.g.
+                {"openai": {"requests_per_minute": 500, "tokens_per_minute": 30000}}
+        """
+        self.limits = limits
+
+        data_dir = ConfigManager().base_dir / "data"
+        data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = data_dir / "rate_limits.sqlite3"
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, "
+                "per_minute REAL, blocked_until REAL NOT NULL DEFAULT 0)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _bucket(self, connection, key: str, per_minute: float, now: float) -> list:
+        """
+        Get the refilled state of a bucket: tokens, learned per minute limit and
+        blocked until time
+        """
+        row = connection.execute(
+            "SELECT tokens, updated_at, per_minute, blocked_until FROM buckets "
+            "WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if not row:
+            return [per_minute, None, 0.0]
+
+        tokens, updated_at, learned, blocked_until = row
+        per_minute = learned or per_minute
+        tokens = min(per_minute, tokens + (now - updated_at) * per_minute / 60)
+
+        return [tokens, learned, blocked_until]
+
+    def _save(self, connection, key: str, bucket: list, now: float):
+        connection.execute(
+            "INSERT OR REPLACE INTO buckets "
+            "(key, tokens, updated_at, per_minute, blocked_until) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, bucket[0], now, bucket[1], bucket[2]),
+        )
+
+    def _amounts(self, scope: str, model: str | None, tokens: int) -> dict:
+        """
+        Get the bucket keys, amounts and configured limits of a call
+        """
+        amounts = {}
+        prefix = f"{scope}:{model}" if model else scope
+
+        for name, per_minute in self.limits.get(scope, {}).items():
+            kind = name.removesuffix("_per_minute")
+            amount = tokens if kind == "tokens" else 1
+            if per_minute and amount:
+                amounts[f"{prefix}:{kind}"] = (amount, per_minute)
+
+        return amounts
+
+    def reserve(self, amounts: dict, force: bool = False) -> float:
+        """
+        Take the amounts from their buckets, all of them or none
+
+        Args:
+            amounts (dict): The amount and configured per minute limit of each bucket key
+            force (bool): Take the amounts even if the buckets go below zero
+
+        Returns:
+            float: 0 if the amounts were taken, or the seconds to wait before trying again
+        """
+        now = time.time()
+
+        try:
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+
+                buckets = {}
+                wait = 0.0
+                for key, (amount, per_minute) in amounts.items():
+                    bucket = self._bucket(connection, key, per_minute, now)
+                    buckets[key] = bucket
+
+                    # A call bigger than the bucket waits for a full bucket
+                    per_minute = bucket[1] or per_minute
+                    needed = min(amount, per_minute)
+                    wait = max(
+                        wait,
+                        bucket[2] - now,
+                        (needed - bucket[0]) * 60 / per_minute,
+                    )
+
+                if wait > 0 and not force:
+                    return wait
+
+                for key, (amount, _) in amounts.items():
+                    buckets[key][0] -= amount
+                    self._save(connection, key, buckets[key], now)
+        except sqlite3.Error as e:
+            log.warning(f"Could not update the rate limits, not throttling: {e}")
+
+        return 0.0
+
+    def acquire(self, scope: str, model: str = None, tokens: int = 0) -> float:
+        """
+        Wait until a call fits in the rate limits of its scope and model
+
+        Args:
+            scope (str): The rate limited API, "openai", "claude" or "serpapi"
+            model (str): The model of the call, the buckets are per model
+            tokens (int): The estimated tokens of the call
+
+        Returns:
+            float: The seconds waited
+        """
+        amounts = self._amounts(scope, model, tokens)
+        waited = 0.0
+
+        while amounts:
+            wait = self.reserve(amounts)
+            if not wait:
+                break
+
+            # Spread the waiting callers so they don't all wake up at the same time
+            wait *= random.uniform(1, 1.1)
+            log.debug(f"Rate limited on {scope}, waiting {wait:.2f}s")
+            time.sleep(wait)
+            waited += wait
+
+        return waited
+
+    async def acquire_async(self, scope: str, model: str = None, tokens: int = 0):
+        """
+        Async counterpart of acquire, waiting without blocking the event loop
+        """
+        amounts = self._amounts(scope, model, tokens)
+        waited = 0.0
+
+        while amounts:
+            wait = await asyncio.to_thread(self.reserve, amounts)
+            if not wait:
+                break
+
+            wait *= random.uniform(1, 1.1)
+            log.debug(f"Rate limited on {scope}, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+            waited += wait
+
+        return waited
+
+    def record_tokens(self, scope: str, model: str, tokens: int):
+        """
+        Take tokens used after the call (the output tokens) from the tokens bucket
+        """
+        amounts = {
+            key: value
+            for key, value in self._amounts(scope, model, tokens).items()
+            if key.endswith(":tokens")
+        }
+        if amounts:
+            self.reserve(amounts, force=True)
+
+    async def record_tokens_async(self, scope: str, model: str, tokens: int):
+        """
+        Async counterpart of record_tokens, updating the buckets from a thread
+        """
+        await asyncio.to_thread(self.record_tokens, scope, model, tokens)
+
+    def observe_headers(self, scope: str, model: str, headers):
+        """
+        Adapt the buckets to the rate limits reported in the response headers
+
+        The limit replaces the configured one, the remaining quota caps the bucket
+        (other machines may share the API key) and an exhausted quota blocks the
+        bucket until its reset time.
+
+        Args:
+            scope (str): The rate limited API
+            model (str): The model of the call
+            headers: The response headers
+        """
+        if headers is None:
+            return
+
+        reported = parse_rate_limit_headers(headers)
+        if not reported:
+            return
+
+        now = time.time()
+        configured = self.limits.get(scope, {})
+
+        try:
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+
+                for kind, values in reported.items():
+                    per_minute = configured.get(f"{kind}_per_minute")
+                    if not per_minute:
+                        continue
+
+                    key = f"{scope}:{model}:{kind}"
+                    bucket = self._bucket(connection, key, per_minute, now)
+
+                    if values.get("limit"):
+                        bucket[1] = values["limit"]
+
+                    if "remaining" in values:
+                        bucket[0] = min(bucket[0], values["remaining"])
+
+                        if values["remaining"] < 1 and values.get("reset"):
+                            bucket[2] = max(bucket[2], now + values["reset"])
+
+                    self._save(connection, key, bucket, now)
+        except sqlite3.Error as e:
+            log.warning(f"Could not update the rate limits: {e}")
+
+    async def observe_headers_async(self, scope: str, model: str, headers):
+        """
+        Async counterpart of observe_headers, updating the buckets from a thread
+        """
+        await asyncio.to_thread(self.observe_headers, scope, model, headers)
+
+    def block(self, scope: str, model: str, seconds: float):
+        """
+        Stop every call of a scope and model for some seconds, after a rate limit error
+
+        Args:
+            scope (str): The rate limited API
+            model (str): The model of the call
+            seconds (float): The seconds to block the calls for
+        """
+        now = time.time()
+        amounts = self._amounts(scope, model, 1)
+
+        try:
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+
+                for key, (_, per_minute) in amounts.items():
+                    bucket = self._bucket(connection, key, per_minute, now)
+                    bucket[2] = max(bucket[2], now + seconds)
+                    self._save(connection, key, bucket, now)
+        except sqlite3.Error as e:
+            log.warning(f"Could not update the rate limits: {e}")
+
+    async def block_async(self, scope: str, model: str, seconds: float):
+        """
+        Async counterpart of block, updating the buckets from a thread
+        """
+        await asyncio.to_thread(self.block, scope, model, seconds)
+
+
+rate_limiter = None
+rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """
+    Get the process-wide rate limiter
+
+    Returns:
+        RateLimiter | None: The rate limiter, or None if rate limiting is disabled
+    """
+    global rate_limiter
+
+    rate_limit_config = ConfigManager().load_params()["rate_limit_params"]
+
+    if not rate_limit_config["enabled"]:
+        return None
+
+    with rate_limiter_lock:
+        limits = {
+            scope: limits
+            for scope, limits in rate_limit_config.items()
+            if isinstance(limits, dict)
+        }
+
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(limits)
+        rate_limiter.limits = limits
+
+        return rate_limiter
+
+
+async def get_rate_limiter_async() -> RateLimiter | None:
+    """
+    Async counterpart of get_rate_limiter, reading the params from a thread
+    """
+    return await asyncio.to_thread(get_rate_limiter)